@@ -0,0 +1,181 @@
+import time
+import uuid
+from collections import Counter
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class FakeTable:
+    """Filas de una tabla con índices por columna creados al primer uso"""
+
+    def __init__(self):
+        self.rows = []
+        self.indexes = {}
+
+    def index(self, column):
+        if column not in self.indexes:
+            index = {}
+            for row in self.rows:
+                index.setdefault(row.get(column), []).append(row)
+            self.indexes[column] = index
+        return self.indexes[column]
+
+    def add(self, row):
+        row.setdefault('id', str(uuid.uuid4()))
+        self.rows.append(row)
+        for column, index in self.indexes.items():
+            index.setdefault(row.get(column), []).append(row)
+        return row
+
+    def update(self, row, values):
+        for column, index in self.indexes.items():
+            if column in values and values[column] != row.get(column):
+                index[row.get(column)].remove(row)
+                index.setdefault(values[column], []).append(row)
+        row.update(values)
+
+class FakeQuery:
+    """Subconjunto del query builder de postgrest que usan los importadores"""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.table = client.tables.setdefault(name, FakeTable())
+        self.name = name
+        self.operation = 'select'
+        self.columns = '*'
+        self.count = None
+        self.filters = []
+        self.payload = None
+        self.on_conflict = 'id'
+        self.ignore_duplicates = False
+
+    def select(self, columns='*', count=None):
+        self.operation = 'select'
+        self.columns = columns
+        self.count = count
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, {value}))
+        return self
+
+    def in_(self, column, values):
+        self.filters.append((column, set(values)))
+        return self
+
+    def insert(self, payload):
+        self.operation = 'insert'
+        self.payload = payload if isinstance(payload, list) else [payload]
+        return self
+
+    def upsert(self, payload, on_conflict='id', ignore_duplicates=False):
+        self.operation = 'upsert'
+        self.payload = payload if isinstance(payload, list) else [payload]
+        self.on_conflict = on_conflict
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, payload):
+        self.operation = 'update'
+        self.payload = payload
+        return self
+
+    def _matching(self):
+        if not self.filters:
+            return list(self.table.rows)
+        # El primer filtro usa el índice; el resto se comprueba fila por fila
+        column, values = self.filters[0]
+        index = self.table.index(column)
+        rows = [row for value in values for row in index.get(value, [])]
+        return [
+            row for row in rows
+            if all(row.get(other) in allowed for other, allowed in self.filters[1:])
+        ]
+
+    def _project(self, row):
+        if self.columns.strip() == '*':
+            return dict(row)
+        return {column.strip(): row.get(column.strip()) for column in self.columns.split(',')}
+
+    def _existing(self, record, keys):
+        candidates = self.table.index(keys[0]).get(record.get(keys[0]), [])
+        for row in candidates:
+            if all(row.get(key) == record.get(key) for key in keys[1:]):
+                return row
+        return None
+
+    def execute(self):
+        self.client.record_call(self.name, self.operation)
+
+        if self.operation == 'select':
+            rows = self._matching()
+            return FakeResponse([self._project(row) for row in rows], len(rows) if self.count else None)
+
+        if self.operation == 'insert':
+            return FakeResponse([dict(self.table.add(dict(record))) for record in self.payload])
+
+        if self.operation == 'upsert':
+            keys = [key.strip() for key in self.on_conflict.split(',')]
+            returned = []
+            for record in self.payload:
+                existing = self._existing(record, keys)
+                if existing is None:
+                    returned.append(dict(self.table.add(dict(record))))
+                elif not self.ignore_duplicates:
+                    self.table.update(existing, record)
+                    returned.append(dict(existing))
+            return FakeResponse(returned)
+
+        rows = self._matching()
+        for row in rows:
+            self.table.update(row, self.payload)
+        return FakeResponse([dict(row) for row in rows])
+
+class FakeRpc:
+    """Llamada a una función de Postgres: solo se cuenta, sin efecto"""
+
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        self.client.record_call('rpc', self.name)
+        return FakeResponse(None)
+
+class FakeSupabase:
+    """Cliente de Supabase en memoria que cuenta las llamadas a PostgREST.
+
+    latency simula el tiempo de ida y vuelta de cada llamada (en segundos).
+    """
+
+    def __init__(self, latency=0):
+        self.tables = {}
+        self.latency = latency
+        self.calls = Counter()
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def record_call(self, table, operation):
+        self.calls[f'{table}.{operation}'] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def seed(self, table, rows):
+        """Cargar filas sin contarlas como llamadas"""
+        target = self.tables.setdefault(table, FakeTable())
+        for row in rows:
+            target.add(dict(row))
+
+    def reset_calls(self):
+        self.calls.clear()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return FakeRpc(self, name, params or {})
@@ -0,0 +1,135 @@
+"""Benchmark de los importadores contra un cliente de Supabase en memoria.
+
+Genera libros sintéticos de pacientes, pagos y citas y ejecuta cada importador
+en un proceso propio (para que el pico de memoria sea el de ese caso). Reporta
+filas por segundo, pico de RSS y llamadas a Supabase por fila. No necesita red
+ni credenciales:
+
+    python -m benchmarks.import_benchmark
+    python -m benchmarks.import_benchmark --sizes 1000 10000 --kinds payments --latency 0.02
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+KINDS = ['patients', 'payments', 'appointments']
+DEFAULT_SIZES = [1000, 10000, 100000]
+BENCH_USER = {'id': 'benchmark-user', 'email': 'benchmark@dermacielo.local', 'role': 'administrador'}
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _peak_rss_mb():
+    # En Linux ru_maxrss viene en KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def run_case(kind, rows, path, chunk_size=None, latency=0):
+    """Ejecutar un importador sobre el libro y devolver las métricas del caso"""
+    from src.config import supabase_client
+    from src.routes.import_data import IMPORT_CHUNK_SIZE, _run_import
+    from benchmarks.fake_supabase import FakeSupabase
+    from benchmarks.workbooks import SERVICES, patient_names, patient_pool_size
+
+    client = FakeSupabase(latency=latency)
+    client.seed('users', [{'id': BENCH_USER['id']}])
+    client.seed('services', [{'nombre': name} for name in SERVICES])
+    if kind != 'patients':
+        client.seed('patients', [{'nombre_completo': name} for name in patient_names(patient_pool_size(rows))])
+    # get_supabase_client() devuelve el cliente global si ya existe
+    supabase_client.supabase = client
+
+    file_hash = _file_hash(path)
+    baseline_rss = _peak_rss_mb()
+    with open(path, 'rb') as source:
+        start = time.perf_counter()
+        result = _run_import(
+            kind, source, os.path.basename(path), chunk_size or IMPORT_CHUNK_SIZE, BENCH_USER, file_hash
+        )
+        elapsed = time.perf_counter() - start
+
+    total_rows = result['total_rows']
+    return {
+        'kind': kind,
+        'rows': rows,
+        'imported': result['imported_count'],
+        'errors': len(result['errors']),
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(total_rows / elapsed, 1) if elapsed else 0,
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'rss_growth_mb': round(_peak_rss_mb() - baseline_rss, 1),
+        'supabase_calls': client.total_calls,
+        'calls_per_row': round(client.total_calls / total_rows, 4) if total_rows else 0,
+        'calls_by_table': dict(client.calls)
+    }
+
+def _run_isolated(kind, rows, path, args):
+    command = [
+        sys.executable, '-m', 'benchmarks.import_benchmark',
+        '--case', kind, str(rows), path, '--latency', str(args.latency)
+    ]
+    if args.chunk_size:
+        command += ['--chunk-size', str(args.chunk_size)]
+    completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f'{kind} {rows}: {completed.stderr.strip()}')
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def _print_table(results):
+    header = f"{'tipo':<14}{'filas':>9}{'seg':>9}{'filas/s':>11}{'RSS MB':>9}{'+RSS MB':>9}{'llamadas':>10}{'llam/fila':>11}{'errores':>9}"
+    print(header)
+    print('-' * len(header))
+    for item in results:
+        print(
+            f"{item['kind']:<14}{item['rows']:>9}{item['seconds']:>9.2f}{item['rows_per_second']:>11.0f}"
+            f"{item['peak_rss_mb']:>9.1f}{item['rss_growth_mb']:>9.1f}{item['supabase_calls']:>10}"
+            f"{item['calls_per_row']:>11.4f}{item['errors']:>9}"
+        )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de importación con Supabase en memoria')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=KINDS)
+    parser.add_argument('--format', choices=['xlsx', 'csv'], default='xlsx')
+    parser.add_argument('--data-dir', help='Directorio para conservar los libros generados entre corridas')
+    parser.add_argument('--chunk-size', type=int)
+    parser.add_argument('--latency', type=float, default=0, help='Segundos simulados por llamada a Supabase')
+    parser.add_argument('--json', help='Guardar los resultados en este archivo')
+    parser.add_argument('--case', nargs=3, metavar=('TIPO', 'FILAS', 'RUTA'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        # Proceso hijo: un solo caso, resultado como JSON en la última línea
+        kind, rows, path = args.case
+        print(json.dumps(run_case(kind, int(rows), path, args.chunk_size, args.latency)))
+        return
+
+    from benchmarks.workbooks import workbook_path
+
+    with tempfile.TemporaryDirectory(prefix='import-bench-') as temporary:
+        data_dir = args.data_dir or temporary
+        results = []
+        for rows in args.sizes:
+            for kind in args.kinds:
+                print(f'{kind} {rows}...', file=sys.stderr, flush=True)
+                path = workbook_path(kind, rows, data_dir, args.format)
+                results.append(_run_isolated(kind, rows, path, args))
+
+    _print_table(results)
+
+    if args.json:
+        with open(args.json, 'w') as target:
+            json.dump(results, target, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import os
+import random
+from datetime import date, timedelta
+
+import pandas as pd
+
+from src.routes.import_data import APPOINTMENT_COLUMNS, PATIENT_COLUMNS, PAYMENT_COLUMNS
+
+SERVICES = ['Depilación láser', 'Limpieza facial', 'Peeling químico', 'Radiofrecuencia']
+ZONAS = ['axilas', 'piernas', 'bikini', 'rostro', 'espalda', 'brazos']
+LOCALIDADES = ['Centro', 'Norte', 'Sur', 'Oriente', 'Poniente']
+METODOS = ['efectivo', 'tarjeta', 'transferencia']
+STATUSES = ['agendada', 'confirmada', 'completada']
+
+HEADERS = {
+    'patients': list(PATIENT_COLUMNS),
+    'payments': list(PAYMENT_COLUMNS),
+    'appointments': list(APPOINTMENT_COLUMNS)
+}
+
+def patient_names(count):
+    """Nombres de pacientes deterministas para sembrar el cliente falso"""
+    return [f'Paciente {number:06d}' for number in range(count)]
+
+def patient_pool_size(rows):
+    # Varios pagos/citas por paciente, como en los archivos reales
+    return max(rows // 5, 1)
+
+def _date(rng):
+    return (date(2024, 1, 1) + timedelta(days=rng.randrange(365))).strftime('%d/%m/%Y')
+
+def _patient_row(rng, number):
+    return [
+        f'Paciente {number:06d}',
+        f'55-{rng.randrange(10**7):07d}',
+        rng.choice(LOCALIDADES),
+        ', '.join(rng.sample(ZONAS, rng.randrange(1, 4))),
+        (date(1960, 1, 1) + timedelta(days=rng.randrange(15000))).strftime('%d/%m/%Y'),
+        rng.choice(['', 'Piel sensible', 'Primera visita'])
+    ]
+
+def _payment_row(rng, names):
+    return [
+        _date(rng),
+        rng.choice(names),
+        rng.choice(SERVICES),
+        rng.randrange(300, 3000),
+        rng.choice(METODOS),
+        ''
+    ]
+
+def _appointment_row(rng, names):
+    return [
+        _date(rng),
+        f'{rng.randrange(9, 19):02d}:{rng.choice(["00", "30"])}',
+        rng.choice(names),
+        rng.choice(SERVICES),
+        rng.randrange(1, 11),
+        rng.randrange(300, 3000),
+        rng.choice(STATUSES)
+    ]
+
+def build_frame(kind, rows, seed=0):
+    """DataFrame sintético con los encabezados que espera cada importador"""
+    rng = random.Random(seed)
+    if kind == 'patients':
+        data = [_patient_row(rng, number) for number in range(rows)]
+    else:
+        names = patient_names(patient_pool_size(rows))
+        make_row = _payment_row if kind == 'payments' else _appointment_row
+        data = [make_row(rng, names) for _ in range(rows)]
+    return pd.DataFrame(data, columns=HEADERS[kind])
+
+def workbook_path(kind, rows, data_dir, file_format='xlsx'):
+    """Ruta del libro sintético; se genera solo si no existe todavía"""
+    path = os.path.join(data_dir, f'{kind}_{rows}.{file_format}')
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        df = build_frame(kind, rows)
+        if file_format == 'csv':
+            df.to_csv(path, index=False)
+        else:
+            df.to_excel(path, index=False)
+    return path
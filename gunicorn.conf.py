@@ -0,0 +1,11 @@
+import os
+
+# Workers con hilos: cada conexión de /appointments/events ocupa un hilo y no el worker completo
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# Un solo worker: el bus de eventos (y los ids de Last-Event-ID) viven en el proceso.
+# Para más de uno hace falta un bus entre procesos (EVENT_BUS, ver src/utils/events.py)
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+# Las conexiones SSE se cierran cada EVENTS_MAX_SECONDS, por debajo de este timeout
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
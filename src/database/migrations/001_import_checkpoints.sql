@@ -0,0 +1,15 @@
+-- Puntos de control de importaciones, identificadas por el hash del archivo
+create table if not exists import_checkpoints (
+    file_hash text not null,
+    import_type text not null,
+    chunk_size integer not null,
+    chunks_committed integer not null default 0,
+    status text not null default 'en_proceso',
+    result jsonb,
+    created_by uuid references users(id),
+    updated_at timestamptz not null default now(),
+    primary key (file_hash, import_type)
+);
+
+-- Los pagos importados usan un ticket determinista para poder reintentar sin duplicar
+create unique index if not exists payments_ticket_number_key on payments (ticket_number);
@@ -0,0 +1,2 @@
+-- Paginación por cursor de GET /api/payments: orden (created_at, id) servido por índice
+create index if not exists payments_created_at_id_idx on payments (created_at desc, id desc);
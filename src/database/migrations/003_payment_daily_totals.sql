@@ -0,0 +1,60 @@
+-- Totales diarios de ingresos por método de pago y cajero (lectura de /payments/stats)
+create table if not exists payment_daily_totals (
+    day date not null,
+    payment_method text not null,
+    cashier_id uuid references users(id),
+    total_amount numeric(12, 2) not null default 0,
+    payments_count integer not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+create unique index if not exists payment_daily_totals_key
+    on payment_daily_totals (day, payment_method, cashier_id) nulls not distinct;
+
+-- Sumar pagos nuevos: [{day, payment_method, cashier_id, total_amount, payments_count}, ...]
+create or replace function add_payment_daily_totals(p_totals jsonb)
+returns void
+language sql
+as $$
+    insert into payment_daily_totals (day, payment_method, cashier_id, total_amount, payments_count)
+    select
+        (item->>'day')::date,
+        coalesce(item->>'payment_method', 'desconocido'),
+        (item->>'cashier_id')::uuid,
+        (item->>'total_amount')::numeric,
+        (item->>'payments_count')::integer
+    from jsonb_array_elements(p_totals) as item
+    on conflict (day, payment_method, cashier_id) do update set
+        total_amount = payment_daily_totals.total_amount + excluded.total_amount,
+        payments_count = payment_daily_totals.payments_count + excluded.payments_count,
+        updated_at = now();
+$$;
+
+-- Recalcular los totales desde la tabla de pagos (todo el historial o un rango de días)
+create or replace function rebuild_payment_daily_totals(p_from date default null, p_to date default null)
+returns integer
+language plpgsql
+as $$
+declare
+    rebuilt integer;
+begin
+    -- Evitar que un incremento concurrente se pierda entre el borrado y el recálculo
+    lock table payment_daily_totals in share row exclusive mode;
+
+    delete from payment_daily_totals
+    where (p_from is null or day >= p_from) and (p_to is null or day <= p_to);
+
+    insert into payment_daily_totals (day, payment_method, cashier_id, total_amount, payments_count)
+    select created_at::date, coalesce(payment_method, 'desconocido'), cashier_id,
+           coalesce(sum(total_amount), 0), count(*)
+    from payments
+    where (p_from is null or created_at >= p_from) and (p_to is null or created_at < p_to + 1)
+    group by 1, 2, 3;
+
+    get diagnostics rebuilt = row_count;
+    return rebuilt;
+end;
+$$;
+
+-- Llenar los totales con los pagos que ya existen
+select rebuild_payment_daily_totals();
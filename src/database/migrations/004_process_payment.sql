@@ -0,0 +1,42 @@
+-- Registrar un pago completo en una sola llamada y una sola transacción:
+-- pago, relación con las citas, citas marcadas como pagadas y totales diarios.
+-- p_payment tiene las columnas de payments; p_appointments es [{appointment_id, amount}, ...]
+create or replace function process_payment(p_payment jsonb, p_appointments jsonb)
+returns payments.id%type
+language plpgsql
+as $$
+declare
+    payment payments%rowtype;
+begin
+    insert into payments (
+        ticket_number, payment_method, total_amount, amount_paid,
+        discount, change_amount, cashier_id, created_at
+    )
+    select ticket_number, payment_method, total_amount, amount_paid,
+           coalesce(discount, 0), coalesce(change_amount, 0), cashier_id, created_at
+    from jsonb_populate_record(null::payments, p_payment)
+    returning * into payment;
+
+    insert into payment_appointments (payment_id, appointment_id, amount)
+    select payment.id, item.appointment_id, item.amount
+    from jsonb_populate_recordset(null::payment_appointments, p_appointments) as item;
+
+    -- Todas las citas del pago en un solo update
+    update appointments
+    set is_paid = true, metodo_pago = payment.payment_method
+    where id in (
+        select item.appointment_id
+        from jsonb_populate_recordset(null::payment_appointments, p_appointments) as item
+    );
+
+    perform add_payment_daily_totals(jsonb_build_array(jsonb_build_object(
+        'day', payment.created_at::date,
+        'payment_method', payment.payment_method,
+        'cashier_id', payment.cashier_id,
+        'total_amount', payment.total_amount,
+        'payments_count', 1
+    )));
+
+    return payment.id;
+end;
+$$;
@@ -0,0 +1,97 @@
+-- Búsqueda de pagos por paciente (nombre y teléfono) y ticket con índice GIN.
+-- search_text se guarda sin acentos y en minúsculas; la consulta usa prefijos (fts).
+create extension if not exists unaccent;
+
+alter table payments add column if not exists search_text text;
+alter table payments add column if not exists search_vector tsvector
+    generated always as (to_tsvector('simple', coalesce(search_text, ''))) stored;
+
+create index if not exists payments_search_vector_idx on payments using gin (search_vector);
+
+-- Ticket más nombre y teléfono (solo dígitos) de los pacientes del pago
+create or replace function payment_search_text(p_payment_id payments.id%type)
+returns text
+language sql
+stable
+as $$
+    select lower(unaccent(concat_ws(' ',
+        p.ticket_number,
+        string_agg(distinct concat_ws(' ', pt.nombre_completo, regexp_replace(coalesce(pt.telefono, ''), '\D', '', 'g')), ' ')
+    )))
+    from payments p
+    left join payment_appointments pa on pa.payment_id = p.id
+    left join appointments a on a.id = pa.appointment_id
+    left join patients pt on pt.id = coalesce(a.patient_id, p.patient_id)
+    where p.id = p_payment_id
+    group by p.id, p.ticket_number;
+$$;
+
+-- Pagos insertados con patient_id (importaciones): la clave se arma al insertar
+create or replace function payments_set_search_text()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.search_text is null then
+        select lower(unaccent(concat_ws(' ',
+            new.ticket_number, pt.nombre_completo, regexp_replace(coalesce(pt.telefono, ''), '\D', '', 'g')
+        )))
+        into new.search_text
+        from patients pt
+        where pt.id = new.patient_id;
+        new.search_text := coalesce(new.search_text, lower(unaccent(coalesce(new.ticket_number, ''))));
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists payments_search_text on payments;
+create trigger payments_search_text
+    before insert on payments
+    for each row execute function payments_set_search_text();
+
+-- process_payment: la clave incluye a los pacientes de las citas pagadas
+create or replace function process_payment(p_payment jsonb, p_appointments jsonb)
+returns payments.id%type
+language plpgsql
+as $$
+declare
+    payment payments%rowtype;
+begin
+    insert into payments (
+        ticket_number, payment_method, total_amount, amount_paid,
+        discount, change_amount, cashier_id, created_at
+    )
+    select ticket_number, payment_method, total_amount, amount_paid,
+           coalesce(discount, 0), coalesce(change_amount, 0), cashier_id, created_at
+    from jsonb_populate_record(null::payments, p_payment)
+    returning * into payment;
+
+    insert into payment_appointments (payment_id, appointment_id, amount)
+    select payment.id, item.appointment_id, item.amount
+    from jsonb_populate_recordset(null::payment_appointments, p_appointments) as item;
+
+    -- Todas las citas del pago en un solo update
+    update appointments
+    set is_paid = true, metodo_pago = payment.payment_method
+    where id in (
+        select item.appointment_id
+        from jsonb_populate_recordset(null::payment_appointments, p_appointments) as item
+    );
+
+    update payments set search_text = payment_search_text(payment.id) where id = payment.id;
+
+    perform add_payment_daily_totals(jsonb_build_array(jsonb_build_object(
+        'day', payment.created_at::date,
+        'payment_method', payment.payment_method,
+        'cashier_id', payment.cashier_id,
+        'total_amount', payment.total_amount,
+        'payments_count', 1
+    )));
+
+    return payment.id;
+end;
+$$;
+
+-- Pagos existentes
+update payments set search_text = payment_search_text(id) where search_text is null;
@@ -0,0 +1,112 @@
+-- Corte de caja: descuentos y cambio en los totales diarios y cortes congelados por cajero
+alter table payment_daily_totals add column if not exists discount_total numeric(12, 2) not null default 0;
+alter table payment_daily_totals add column if not exists change_total numeric(12, 2) not null default 0;
+
+create or replace function add_payment_daily_totals(p_totals jsonb)
+returns void
+language sql
+as $$
+    insert into payment_daily_totals (
+        day, payment_method, cashier_id, total_amount, payments_count, discount_total, change_total
+    )
+    select
+        (item->>'day')::date,
+        coalesce(item->>'payment_method', 'desconocido'),
+        (item->>'cashier_id')::uuid,
+        (item->>'total_amount')::numeric,
+        (item->>'payments_count')::integer,
+        coalesce((item->>'discount_total')::numeric, 0),
+        coalesce((item->>'change_total')::numeric, 0)
+    from jsonb_array_elements(p_totals) as item
+    on conflict (day, payment_method, cashier_id) do update set
+        total_amount = payment_daily_totals.total_amount + excluded.total_amount,
+        payments_count = payment_daily_totals.payments_count + excluded.payments_count,
+        discount_total = payment_daily_totals.discount_total + excluded.discount_total,
+        change_total = payment_daily_totals.change_total + excluded.change_total,
+        updated_at = now();
+$$;
+
+create or replace function rebuild_payment_daily_totals(p_from date default null, p_to date default null)
+returns integer
+language plpgsql
+as $$
+declare
+    rebuilt integer;
+begin
+    -- Evitar que un incremento concurrente se pierda entre el borrado y el recálculo
+    lock table payment_daily_totals in share row exclusive mode;
+
+    delete from payment_daily_totals
+    where (p_from is null or day >= p_from) and (p_to is null or day <= p_to);
+
+    insert into payment_daily_totals (
+        day, payment_method, cashier_id, total_amount, payments_count, discount_total, change_total
+    )
+    select created_at::date, coalesce(payment_method, 'desconocido'), cashier_id,
+           coalesce(sum(total_amount), 0), count(*),
+           coalesce(sum(discount), 0), coalesce(sum(change_amount), 0)
+    from payments
+    where (p_from is null or created_at >= p_from) and (p_to is null or created_at < p_to + 1)
+    group by 1, 2, 3;
+
+    get diagnostics rebuilt = row_count;
+    return rebuilt;
+end;
+$$;
+
+create or replace function process_payment(p_payment jsonb, p_appointments jsonb)
+returns payments.id%type
+language plpgsql
+as $$
+declare
+    payment payments%rowtype;
+begin
+    insert into payments (
+        ticket_number, payment_method, total_amount, amount_paid,
+        discount, change_amount, cashier_id, created_at
+    )
+    select ticket_number, payment_method, total_amount, amount_paid,
+           coalesce(discount, 0), coalesce(change_amount, 0), cashier_id, created_at
+    from jsonb_populate_record(null::payments, p_payment)
+    returning * into payment;
+
+    insert into payment_appointments (payment_id, appointment_id, amount)
+    select payment.id, item.appointment_id, item.amount
+    from jsonb_populate_recordset(null::payment_appointments, p_appointments) as item;
+
+    -- Todas las citas del pago en un solo update
+    update appointments
+    set is_paid = true, metodo_pago = payment.payment_method
+    where id in (
+        select item.appointment_id
+        from jsonb_populate_recordset(null::payment_appointments, p_appointments) as item
+    );
+
+    update payments set search_text = payment_search_text(payment.id) where id = payment.id;
+
+    perform add_payment_daily_totals(jsonb_build_array(jsonb_build_object(
+        'day', payment.created_at::date,
+        'payment_method', payment.payment_method,
+        'cashier_id', payment.cashier_id,
+        'total_amount', payment.total_amount,
+        'payments_count', 1,
+        'discount_total', payment.discount,
+        'change_total', payment.change_amount
+    )));
+
+    return payment.id;
+end;
+$$;
+
+-- Corte congelado: los totales del cajero en el momento de cerrar el día
+create table if not exists cash_closes (
+    day date not null,
+    cashier_id uuid not null references users(id),
+    totals jsonb not null,
+    closed_by uuid references users(id),
+    closed_at timestamptz not null default now(),
+    primary key (day, cashier_id)
+);
+
+-- Recalcular los totales con descuento y cambio
+select rebuild_payment_daily_totals();
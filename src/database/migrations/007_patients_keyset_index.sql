@@ -0,0 +1,2 @@
+-- Paginación por cursor de GET /api/patients: orden (nombre_completo, id) servido por índice
+create index if not exists patients_nombre_completo_id_idx on patients (nombre_completo, id);
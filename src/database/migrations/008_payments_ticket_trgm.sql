@@ -0,0 +1,4 @@
+-- Búsqueda de pagos por cualquier parte del ticket (ilike '%ABC123%') con índice de trigramas
+create extension if not exists pg_trgm;
+
+create index if not exists payments_ticket_number_trgm_idx on payments using gin (ticket_number gin_trgm_ops);
@@ -0,0 +1,51 @@
+-- process_payment devuelve también las citas pagadas para avisar a los calendarios sin otra consulta
+drop function if exists process_payment(jsonb, jsonb);
+
+create function process_payment(p_payment jsonb, p_appointments jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    payment payments%rowtype;
+    paid jsonb;
+begin
+    insert into payments (
+        ticket_number, payment_method, total_amount, amount_paid,
+        discount, change_amount, cashier_id, created_at
+    )
+    select ticket_number, payment_method, total_amount, amount_paid,
+           coalesce(discount, 0), coalesce(change_amount, 0), cashier_id, created_at
+    from jsonb_populate_record(null::payments, p_payment)
+    returning * into payment;
+
+    insert into payment_appointments (payment_id, appointment_id, amount)
+    select payment.id, item.appointment_id, item.amount
+    from jsonb_populate_recordset(null::payment_appointments, p_appointments) as item;
+
+    -- Todas las citas del pago en un solo update, devolviendo lo que necesitan los eventos
+    with updated as (
+        update appointments
+        set is_paid = true, metodo_pago = payment.payment_method
+        where id in (
+            select item.appointment_id
+            from jsonb_populate_recordset(null::payment_appointments, p_appointments) as item
+        )
+        returning id, fecha_hora, operadora_id, status, is_paid
+    )
+    select coalesce(jsonb_agg(to_jsonb(updated)), '[]'::jsonb) into paid from updated;
+
+    update payments set search_text = payment_search_text(payment.id) where id = payment.id;
+
+    perform add_payment_daily_totals(jsonb_build_array(jsonb_build_object(
+        'day', payment.created_at::date,
+        'payment_method', payment.payment_method,
+        'cashier_id', payment.cashier_id,
+        'total_amount', payment.total_amount,
+        'payments_count', 1,
+        'discount_total', payment.discount,
+        'change_total', payment.change_amount
+    )));
+
+    return jsonb_build_object('payment_id', payment.id, 'appointments', paid);
+end;
+$$;
@@ -0,0 +1,32 @@
+-- Búsqueda de pacientes en la base (respaldo del índice en memoria) y lectura incremental de cambios.
+-- search_text: nombre y teléfono (solo dígitos) sin acentos y en minúsculas, con índice de trigramas
+create extension if not exists unaccent;
+create extension if not exists pg_trgm;
+
+alter table patients add column if not exists search_text text;
+alter table patients add column if not exists updated_at timestamptz not null default now();
+
+create or replace function patients_set_search_fields()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.search_text := lower(unaccent(concat_ws(' ',
+        new.nombre_completo, regexp_replace(coalesce(new.telefono, ''), '\D', '', 'g')
+    )));
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists patients_search_fields on patients;
+create trigger patients_search_fields
+    before insert or update on patients
+    for each row execute function patients_set_search_fields();
+
+-- Pacientes existentes (el trigger calcula la clave)
+update patients set search_text = null where search_text is null;
+
+create index if not exists patients_search_text_trgm_idx on patients using gin (search_text gin_trgm_ops);
+-- Lectura incremental del índice en memoria: updated_at > último leído
+create index if not exists patients_updated_at_id_idx on patients (updated_at, id);
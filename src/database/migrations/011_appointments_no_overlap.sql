@@ -0,0 +1,48 @@
+-- Una operadora no puede tener dos citas vigentes que se crucen, aunque las escriban workers distintos.
+-- Un candado por operadora serializa la revisión y la escritura dentro de la transacción de cada
+-- insert/update. Las citas que ya terminaron (historial importado) no se revisan, para no rechazar
+-- datos antiguos que ya se cruzaban; por lo mismo no se usa una restricción exclude.
+create or replace function appointments_check_overlap()
+returns trigger
+language plpgsql
+as $$
+declare
+    conflict_id appointments.id%type;
+    ends_at timestamptz;
+begin
+    if new.operadora_id is null or new.fecha_hora is null or new.status = 'cancelada' then
+        return new;
+    end if;
+    ends_at := new.fecha_hora + make_interval(mins => coalesce(new.duracion_minutos, 30));
+    if ends_at <= now() then
+        return new;
+    end if;
+
+    perform pg_advisory_xact_lock(hashtext('appointments:' || new.operadora_id::text));
+
+    select a.id into conflict_id
+    from appointments a
+    where a.operadora_id = new.operadora_id
+      and a.id <> new.id
+      and a.status is distinct from 'cancelada'
+      and a.fecha_hora < ends_at
+      and a.fecha_hora + make_interval(mins => coalesce(a.duracion_minutos, 30)) > new.fecha_hora
+    limit 1;
+
+    if conflict_id is not null then
+        raise exception using
+            errcode = 'exclusion_violation',
+            message = 'La operadora ya tiene una cita en ese horario',
+            detail = conflict_id::text;
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists appointments_no_overlap on appointments;
+create trigger appointments_no_overlap
+    before insert or update of fecha_hora, duracion_minutos, operadora_id, status on appointments
+    for each row execute function appointments_check_overlap();
+
+-- Búsqueda de cruces por operadora y hora
+create index if not exists appointments_operadora_fecha_hora_idx on appointments (operadora_id, fecha_hora);
@@ -0,0 +1,15 @@
+-- Estado de las importaciones en segundo plano, para consultarlas o cancelarlas desde cualquier worker
+create table if not exists import_jobs (
+    id uuid primary key,
+    import_type text not null,
+    user_id uuid,
+    status text not null default 'pendiente',
+    -- Último estado del trabajo tal como lo devuelve GET /api/import/jobs/<id>
+    state jsonb not null default '{}'::jsonb,
+    -- Lo marca el worker que recibe la cancelación; el que ejecuta el trabajo lo revisa entre bloques
+    cancel_requested boolean not null default false,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists import_jobs_user_id_idx on import_jobs (user_id, created_at desc);
@@ -1,47 +1,157 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from src.config.supabase_client import get_supabase_client
-from src.utils.auth import require_auth, require_role
+from src.utils.auth import require_auth, require_role, require_stream_auth
+from src.utils.projection import list_select
+from src.utils.pagination import LOAD_PAGE_SIZE, decode_cursor, keyset_page, parse_limit, split_page
+from src.utils.calendar_cache import calendar_cache
+from src.utils.availability import (
+    availability_index, blocks_agenda, parse_fecha_hora, booking_interval,
+    operadora_bookings, overlapping_booking
+)
+from src.utils.events import appointment_event, get_event_bus
 from datetime import datetime, timedelta
+from postgrest.exceptions import APIError
+import json
+import os
+import time
 
 appointments_bp = Blueprint('appointments', __name__)
 
+APPOINTMENT_LIST_SELECT = '''
+    *,
+    patients(nombre_completo, telefono),
+    services(nombre, zona),
+    operadora:users!appointments_operadora_id_fkey(full_name),
+    cajera:users!appointments_cajera_id_fkey(full_name)
+'''
+
+# Columnas de la agenda en pantalla (view=summary)
+APPOINTMENT_SUMMARY_SELECT = '''
+    id, fecha_hora, status, is_paid, patient_id, service_id,
+    patients(nombre_completo), services(nombre)
+'''
+
+def _appointments_changed(*appointments, event='appointment.updated'):
+    """Actualizar lo que depende de las citas escritas (calendario en caché, disponibilidad y eventos)"""
+    appointments = [appointment for appointment in appointments if appointment]
+    calendar_cache.invalidate_appointments(appointments)
+    # La primera es la versión anterior cuando se actualiza; la última es la vigente
+    if appointments:
+        availability_index.apply(appointments[-1])
+        get_event_bus().publish(appointment_event(event, *appointments))
+
+# Campos que cambian el horario ocupado por la operadora
+SCHEDULE_FIELDS = {'fecha_hora', 'duracion_minutos', 'operadora_id', 'status'}
+
+def _booking_conflict(supabase, appointment, exclude_id=None):
+    """Id de la cita de la misma operadora que se cruza con appointment, o None.
+
+    Se consulta la base y no el índice de disponibilidad, que puede no tener
+    aún las citas que reservó otro worker.
+    """
+    if not blocks_agenda(appointment):
+        return None
+    day = booking_interval(appointment)[0].date()
+    bookings = operadora_bookings(supabase, appointment['operadora_id'], day, day)
+    return overlapping_booking(bookings, appointment, exclude_id)
+
+def _conflict_response(conflict_id):
+    return jsonify({
+        'error': 'La operadora ya tiene una cita en ese horario',
+        'conflict_appointment_id': conflict_id
+    }), 409
+
+def _execute_booking(query):
+    """Ejecutar el insert/update de citas: (resultado, None) o (None, respuesta 409).
+
+    La base rechaza los cruces (migración 011) aunque otro worker haya reservado
+    el hueco después de la revisión previa.
+    """
+    try:
+        return query.execute(), None
+    except APIError as e:
+        if e.code != '23P01':
+            raise
+        return None, _conflict_response(e.details or None)
+
+# Orden estable para la paginación por cursor (el id desempata citas a la misma hora)
+APPOINTMENT_SORT = ['fecha_hora', 'id']
+APPOINTMENTS_PAGE_SIZE = 100
+APPOINTMENTS_STREAM_PAGE_SIZE = int(os.getenv('APPOINTMENTS_STREAM_PAGE_SIZE', 500))
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def _apply_appointment_filters(query, args):
+    """Filtros del listado de citas a partir del query string"""
+    if args.get('date_from'):
+        query = query.gte('fecha_hora', args['date_from'])
+    if args.get('date_to'):
+        query = query.lte('fecha_hora', args['date_to'])
+    if args.get('status'):
+        query = query.eq('status', args['status'])
+    if args.get('patient_id'):
+        query = query.eq('patient_id', args['patient_id'])
+    return query
+
+def _appointments_page(supabase, columns, args, cursor, limit):
+    query = _apply_appointment_filters(supabase.table('appointments').select(columns), args)
+    result = keyset_page(query, APPOINTMENT_SORT, cursor, limit, descending=False).execute()
+    return split_page(result.data, APPOINTMENT_SORT, limit)
+
+def _wants_ndjson():
+    return request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == NDJSON_MIMETYPE
+
 @appointments_bp.route('', methods=['GET'])
 @require_auth
 def get_appointments():
-    """Obtener lista de citas"""
+    """Obtener lista de citas.
+    
+    Paginación por cursor sobre (fecha_hora, id) con ?cursor= y ?limit=. Con
+    Accept: application/x-ndjson (o ?format=ndjson) se envían todas las citas
+    que cumplen los filtros, una por línea, consultando página por página.
+    """
     try:
         supabase = get_supabase_client()
         if not supabase:
             return jsonify({'error': 'Error de configuración del servidor'}), 500
         
-        # Parámetros de consulta
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        status = request.args.get('status')
-        patient_id = request.args.get('patient_id')
-        
-        # Construir consulta
-        query = supabase.table('appointments').select('''
-            *,
-            patients(nombre_completo, telefono),
-            services(nombre, zona),
-            operadora:users!appointments_operadora_id_fkey(full_name),
-            cajera:users!appointments_cajera_id_fkey(full_name)
-        ''')
-        
-        if date_from:
-            query = query.gte('fecha_hora', date_from)
-        if date_to:
-            query = query.lte('fecha_hora', date_to)
-        if status:
-            query = query.eq('status', status)
-        if patient_id:
-            query = query.eq('patient_id', patient_id)
-        
-        result = query.order('fecha_hora').execute()
+        cursor = request.args.get('cursor')
+        args = request.args.to_dict()
+        try:
+            limit = parse_limit(request.args.get('limit'), default=APPOINTMENTS_PAGE_SIZE)
+            if cursor:
+                decode_cursor(cursor, APPOINTMENT_SORT)
+            # fields= o view=summary reducen el select (sin operadora ni cajera)
+            columns, _ = list_select(
+                request.args, APPOINTMENT_LIST_SELECT, APPOINTMENT_SUMMARY_SELECT, required=APPOINTMENT_SORT
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if _wants_ndjson():
+            # La primera página se consulta antes de responder para poder devolver errores como JSON
+            first_page = _appointments_page(supabase, columns, args, cursor, APPOINTMENTS_STREAM_PAGE_SIZE)
+            
+            def generate(page, next_cursor):
+                while True:
+                    for appointment in page:
+                        yield json.dumps(appointment, default=str) + '\n'
+                    if not next_cursor:
+                        break
+                    page, next_cursor = _appointments_page(
+                        supabase, columns, args, next_cursor, APPOINTMENTS_STREAM_PAGE_SIZE
+                    )
+            
+            return Response(stream_with_context(generate(*first_page)), mimetype=NDJSON_MIMETYPE)
+        
+        appointments, next_cursor = _appointments_page(supabase, columns, args, cursor, limit)
         
         return jsonify({
-            'appointments': result.data
+            'appointments': appointments,
+            'pagination': {
+                'limit': limit,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
         })
         
     except Exception as e:
@@ -92,7 +202,20 @@ def create_appointment():
             'proxima_cita': data.get('proxima_cita')
         }
         
-        result = supabase.table('appointments').insert(appointment_data).execute()
+        try:
+            parse_fecha_hora(appointment_data['fecha_hora'])
+        except ValueError:
+            return jsonify({'error': 'fecha_hora no válida'}), 400
+        
+        conflict_id = _booking_conflict(supabase, appointment_data)
+        if conflict_id:
+            return _conflict_response(conflict_id)
+        
+        result, conflict = _execute_booking(supabase.table('appointments').insert(appointment_data))
+        if conflict:
+            return conflict
+        if result.data:
+            _appointments_changed(result.data[0], event='appointment.created')
         
         if result.data:
             return jsonify({
@@ -105,6 +228,106 @@ def create_appointment():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Límite de sesiones por serie (un paquete suele ser de 10)
+MAX_SERIES_SESSIONS = 30
+
+@appointments_bp.route('/series', methods=['POST'])
+@require_auth
+@require_role(['administrador', 'cajero'])
+def create_appointment_series():
+    """Crear todas las sesiones de un tratamiento en una sola inserción"""
+    try:
+        data = request.get_json()
+        
+        required_fields = ['patient_id', 'service_id', 'fecha_hora', 'intervalo_dias']
+        for field in required_fields:
+            if not data.get(field):
+                return jsonify({'error': f'{field} es requerido'}), 400
+        
+        supabase = get_supabase_client()
+        if not supabase:
+            return jsonify({'error': 'Error de configuración del servidor'}), 500
+        
+        try:
+            # Se conserva el desfase horario que traiga fecha_hora al calcular las sesiones
+            start = datetime.fromisoformat(str(data['fecha_hora']).replace('Z', '+00:00'))
+            interval = int(data['intervalo_dias'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'fecha_hora o intervalo_dias no válidos'}), 400
+        if interval < 1:
+            return jsonify({'error': 'intervalo_dias debe ser al menos 1'}), 400
+        
+        # Verificar una sola vez paciente y servicio
+        patient_result = supabase.table('patients').select('id').eq('id', data['patient_id']).execute()
+        if not patient_result.data:
+            return jsonify({'error': 'Paciente no encontrado'}), 404
+        
+        service_result = supabase.table('services').select('*').eq('id', data['service_id']).execute()
+        if not service_result.data:
+            return jsonify({'error': 'Servicio no encontrado'}), 404
+        
+        service = service_result.data[0]
+        
+        try:
+            sessions = int(data.get('sesiones') or service.get('sesiones_recomendadas') or 1)
+            first_session = int(data.get('numero_sesion_inicial') or 1)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'sesiones o numero_sesion_inicial no válidos'}), 400
+        if not 1 <= sessions <= MAX_SERIES_SESSIONS:
+            return jsonify({'error': f'sesiones debe estar entre 1 y {MAX_SERIES_SESSIONS}'}), 400
+        
+        appointments = [
+            {
+                'patient_id': data['patient_id'],
+                'service_id': data['service_id'],
+                'operadora_id': data.get('operadora_id'),
+                'cajera_id': request.user['user_id'],
+                'fecha_hora': (start + timedelta(days=interval * position)).isoformat(),
+                'duracion_minutos': data.get('duracion_minutos', service['duracion_minutos']),
+                'numero_sesion': first_session + position,
+                'status': 'agendada',
+                'precio_sesion': data.get('precio_sesion', service['precio_base']),
+                'observaciones_caja': data.get('observaciones_caja')
+            }
+            for position in range(sessions)
+        ]
+        
+        if data.get('operadora_id'):
+            # Una sola consulta para todos los días de la serie
+            last = start + timedelta(days=interval * (sessions - 1))
+            bookings = operadora_bookings(supabase, data['operadora_id'], start.date(), last.date())
+            conflicts = []
+            for appointment in appointments:
+                conflict_id = overlapping_booking(bookings, appointment)
+                if conflict_id:
+                    conflicts.append({
+                        'numero_sesion': appointment['numero_sesion'],
+                        'fecha_hora': appointment['fecha_hora'],
+                        'conflict_appointment_id': conflict_id
+                    })
+            if conflicts:
+                return jsonify({
+                    'error': 'La operadora ya tiene citas en algunos horarios de la serie',
+                    'conflicts': conflicts
+                }), 409
+        
+        result, conflict = _execute_booking(supabase.table('appointments').insert(appointments))
+        if conflict:
+            return conflict
+        for appointment in result.data or []:
+            _appointments_changed(appointment, event='appointment.created')
+        
+        if result.data:
+            return jsonify({
+                'message': 'Serie de citas creada exitosamente',
+                'appointments': result.data
+            }), 201
+        else:
+            return jsonify({'error': 'Error al crear la serie de citas'}), 500
+            
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @appointments_bp.route('/<appointment_id>', methods=['PUT'])
 @require_auth
 def update_appointment(appointment_id):
@@ -117,7 +340,9 @@ def update_appointment(appointment_id):
             return jsonify({'error': 'Error de configuración del servidor'}), 500
         
         # Verificar que la cita existe
-        existing_appointment = supabase.table('appointments').select('id').eq('id', appointment_id).execute()
+        existing_appointment = supabase.table('appointments').select(
+            'id, fecha_hora, duracion_minutos, operadora_id, status'
+        ).eq('id', appointment_id).execute()
         if not existing_appointment.data:
             return jsonify({'error': 'Cita no encontrada'}), 404
         
@@ -134,7 +359,27 @@ def update_appointment(appointment_id):
                 update_data[field] = data[field]
         
         if update_data:
-            result = supabase.table('appointments').update(update_data).eq('id', appointment_id).execute()
+            updated = {**existing_appointment.data[0], **update_data}
+            if 'fecha_hora' in update_data:
+                try:
+                    parse_fecha_hora(updated['fecha_hora'])
+                except ValueError:
+                    return jsonify({'error': 'fecha_hora no válida'}), 400
+            
+            # Solo se revisa el horario si cambia algo que lo afecte
+            if SCHEDULE_FIELDS & update_data.keys():
+                conflict_id = _booking_conflict(supabase, updated, exclude_id=appointment_id)
+                if conflict_id:
+                    return _conflict_response(conflict_id)
+            
+            result, conflict = _execute_booking(
+                supabase.table('appointments').update(update_data).eq('id', appointment_id)
+            )
+            if conflict:
+                return conflict
+            if result.data:
+                # Se invalida el día anterior y el nuevo si la cita se movió
+                _appointments_changed(existing_appointment.data[0], result.data[0])
             
             if result.data:
                 return jsonify({
@@ -152,7 +397,11 @@ def update_appointment(appointment_id):
 @appointments_bp.route('/calendar', methods=['GET'])
 @require_auth
 def get_calendar():
-    """Obtener citas para el calendario"""
+    """Obtener citas para el calendario.
+    
+    Cada día se guarda en caché con su ETag; con If-None-Match vigente se
+    responde 304 sin consultar Supabase.
+    """
     try:
         supabase = get_supabase_client()
         if not supabase:
@@ -160,23 +409,264 @@ def get_calendar():
         
         # Parámetros de consulta
         date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
+        # La fecha es la llave de la caché: solo días válidos y normalizados
+        try:
+            date = str(datetime.strptime(date, '%Y-%m-%d').date())
+        except ValueError:
+            return jsonify({'error': 'date debe tener formato YYYY-MM-DD'}), 400
+        
+        cached = calendar_cache.get(date)
+        if cached:
+            etag, payload = cached
+        else:
+            generation = calendar_cache.generation(date)
+            
+            # Obtener citas del día
+            start_date = f"{date} 00:00:00"
+            end_date = f"{date} 23:59:59"
+            
+            result = supabase.table('appointments').select('''
+                *,
+                patients(nombre_completo, telefono),
+                services(nombre, zona, duracion_minutos),
+                operadora:users!appointments_operadora_id_fkey(full_name)
+            ''').gte('fecha_hora', start_date).lte('fecha_hora', end_date).order('fecha_hora').execute()
+            
+            payload = {
+                'date': date,
+                'appointments': result.data
+            }
+            etag = calendar_cache.set(date, payload, generation)
+        
+        response = jsonify(payload)
+        response.set_etag(etag)
+        # El navegador debe revalidar siempre con el ETag
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
         
-        # Obtener citas del día
-        start_date = f"{date} 00:00:00"
-        end_date = f"{date} 23:59:59"
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Rango máximo de la vista de calendario (un mes con semanas completas)
+MAX_CALENDAR_DAYS = 42
+
+CALENDAR_RANGE_SELECT = '''
+    id, fecha_hora, duracion_minutos, status, is_paid, numero_sesion, operadora_id,
+    patients(nombre_completo), services(nombre)
+'''
+
+def _compact_appointment(appointment):
+    """Cita reducida para las vistas de semana y mes"""
+    return {
+        'id': appointment['id'],
+        'hora': parse_fecha_hora(appointment['fecha_hora']).strftime('%H:%M'),
+        'duracion_minutos': appointment.get('duracion_minutos'),
+        'status': appointment.get('status'),
+        'is_paid': appointment.get('is_paid'),
+        'numero_sesion': appointment.get('numero_sesion'),
+        'paciente': (appointment.get('patients') or {}).get('nombre_completo'),
+        'servicio': (appointment.get('services') or {}).get('nombre')
+    }
+
+@appointments_bp.route('/calendar/range', methods=['GET'])
+@require_auth
+def get_calendar_range():
+    """Citas de una semana o un mes agrupadas por día y operadora"""
+    try:
+        supabase = get_supabase_client()
+        if not supabase:
+            return jsonify({'error': 'Error de configuración del servidor'}), 500
+        
+        try:
+            date_from = datetime.strptime(request.args['date_from'], '%Y-%m-%d').date()
+            date_to = datetime.strptime(request.args['date_to'], '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return jsonify({'error': 'date_from y date_to (YYYY-MM-DD) son requeridos'}), 400
+        
+        total_days = (date_to - date_from).days + 1
+        if not 1 <= total_days <= MAX_CALENDAR_DAYS:
+            return jsonify({'error': f'El rango debe ser de 1 a {MAX_CALENDAR_DAYS} días'}), 400
+        
+        days = {}
+        for offset in range(total_days):
+            day = str(date_from + timedelta(days=offset))
+            days[day] = {'date': day, 'count': 0, 'booked_minutes': 0, 'operadoras': {}}
+        
+        # Todo el rango en páginas por (fecha_hora, id), sin repetir relaciones por día
+        sort = ['fecha_hora', 'id']
+        cursor = None
+        operadora_ids = set()
+        while True:
+            query = supabase.table('appointments').select(CALENDAR_RANGE_SELECT).gte(
+                'fecha_hora', f"{date_from} 00:00:00"
+            ).lte('fecha_hora', f"{date_to} 23:59:59")
+            result = keyset_page(query, sort, cursor, LOAD_PAGE_SIZE, descending=False).execute()
+            page, cursor = split_page(result.data, sort, LOAD_PAGE_SIZE)
+            
+            for appointment in page:
+                day = days.get(str(parse_fecha_hora(appointment['fecha_hora']).date()))
+                if day is None:
+                    continue
+                operadora_id = appointment.get('operadora_id')
+                operadora_ids.add(operadora_id)
+                day['operadoras'].setdefault(operadora_id or 'sin_asignar', []).append(
+                    _compact_appointment(appointment)
+                )
+                day['count'] += 1
+                if appointment.get('status') != 'cancelada':
+                    day['booked_minutes'] += appointment.get('duracion_minutos') or 0
+            
+            if not cursor:
+                break
+        
+        # Nombres de operadora una sola vez para todo el rango
+        operadoras = {}
+        operadora_ids.discard(None)
+        if operadora_ids:
+            users = supabase.table('users').select('id, full_name').in_('id', list(operadora_ids)).execute()
+            operadoras = {user['id']: user['full_name'] for user in users.data}
+        
+        return jsonify({
+            'date_from': str(date_from),
+            'date_to': str(date_to),
+            'operadoras': operadoras,
+            'days': list(days.values())
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Comentario de keep-alive cuando no hay eventos y vida máxima de la conexión
+EVENTS_HEARTBEAT_SECONDS = int(os.getenv('EVENTS_HEARTBEAT_SECONDS', 15))
+# Por debajo del timeout de gunicorn (30 s por defecto) aunque el worker sea síncrono
+EVENTS_MAX_SECONDS = int(os.getenv('EVENTS_MAX_SECONDS', 25))
+EVENTS_RETRY_MS = 3000
+
+def _sse(event_type, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event_type}', f'data: {json.dumps(data, default=str)}']
+    return '\n'.join(lines) + '\n\n'
+
+def _event_matcher(supabase, date, sucursal):
+    """Filtro de eventos por día y por sucursal (a través de las operadoras de la sucursal)"""
+    operadora_ids = None
+    if sucursal:
+        result = supabase.table('users').select('id').eq('sucursal', sucursal).execute()
+        operadora_ids = {user['id'] for user in result.data}
+    
+    def matches(event):
+        if date and date not in event['dates']:
+            return False
+        # Las citas sin operadora se avisan a todas las sucursales
+        if operadora_ids is not None and event['operadora_ids']:
+            return not operadora_ids.isdisjoint(event['operadora_ids'])
+        return True
+    
+    return matches
+
+@appointments_bp.route('/events', methods=['GET'])
+@require_stream_auth
+def appointment_events():
+    """Cambios de citas en vivo por Server-Sent Events.
+    
+    Filtra por ?date=YYYY-MM-DD y ?sucursal=. EventSource no envía encabezados:
+    el token va en ?access_token= o en la cookie access_token. Al reconectar con
+    Last-Event-ID se reenvían los eventos perdidos; si ya no están en el
+    historial (o el id es de otro worker o de antes de un reinicio) se envía un
+    evento resync y el cliente debe recargar el calendario. La conexión se
+    cierra cada EVENTS_MAX_SECONDS y el navegador reconecta solo.
+    """
+    try:
+        supabase = get_supabase_client()
+        if not supabase:
+            return jsonify({'error': 'Error de configuración del servidor'}), 500
+        
+        # Un id desconocido no es un error: el bus pide al cliente que recargue
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        
+        matches = _event_matcher(supabase, request.args.get('date'), request.args.get('sucursal'))
+        
+        def generate():
+            # La suscripción se cierra al terminar o cuando el cliente se desconecta
+            with get_event_bus().subscribe(matches, last_event_id) as subscription:
+                yield f'retry: {EVENTS_RETRY_MS}\n\n'
+                deadline = time.monotonic() + EVENTS_MAX_SECONDS
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if subscription.overflowed:
+                        subscription.overflowed = False
+                        yield _sse('resync', {'reason': 'eventos perdidos'})
+                    event = subscription.get(timeout=min(EVENTS_HEARTBEAT_SECONDS, remaining))
+                    if event is None:
+                        yield ': ping\n\n'
+                        continue
+                    yield _sse(event['type'], event, event['id'])
+        
+        response = Response(generate(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Sin buffer en nginx para que cada evento salga al momento
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@appointments_bp.route('/availability', methods=['GET'])
+@require_auth
+def get_availability():
+    """Próximos huecos libres para un servicio, con cualquier operadora o una en particular"""
+    try:
+        supabase = get_supabase_client()
+        if not supabase:
+            return jsonify({'error': 'Error de configuración del servidor'}), 500
+        
+        service_id = request.args.get('service_id')
+        if not service_id:
+            return jsonify({'error': 'service_id es requerido'}), 400
+        
+        operadora_id = request.args.get('operadora_id')
+        count = min(int(request.args.get('count', 5)), 50)
+        days = min(int(request.args.get('days', 14)), 62)
+        now = datetime.now()
+        first = datetime.strptime(request.args['date_from'], '%Y-%m-%d').date() if request.args.get('date_from') else now.date()
+        
+        service_result = supabase.table('services').select('id, nombre, duracion_minutos').eq('id', service_id).execute()
+        if not service_result.data:
+            return jsonify({'error': 'Servicio no encontrado'}), 404
+        service = service_result.data[0]
+        
+        # Operadoras: la indicada o todas las cosmetólogas activas
+        query = supabase.table('users').select('id, full_name, roles!inner(name)').eq('is_active', True)
+        if operadora_id:
+            query = query.eq('id', operadora_id)
+        else:
+            query = query.eq('roles.name', 'cosmetologa')
+        operadoras = {user['id']: user['full_name'] for user in query.execute().data}
+        if operadora_id and not operadoras:
+            return jsonify({'error': 'Operadora no encontrada'}), 404
         
-        result = supabase.table('appointments').select('''
-            *,
-            patients(nombre_completo, telefono),
-            services(nombre, zona, duracion_minutos),
-            operadora:users!appointments_operadora_id_fkey(full_name)
-        ''').gte('fecha_hora', start_date).lte('fecha_hora', end_date).order('fecha_hora').execute()
+        availability_index.ensure(supabase, first, first + timedelta(days=days - 1))
+        slots = availability_index.free_slots(
+            list(operadoras), service.get('duracion_minutos') or 30, first, days, count, not_before=now
+        )
         
         return jsonify({
-            'date': date,
-            'appointments': result.data
+            'service': service,
+            'slots': [
+                {
+                    'operadora_id': slot['operadora_id'],
+                    'operadora': operadoras[slot['operadora_id']],
+                    'fecha_hora': slot['start'].isoformat(),
+                    'fin': slot['end'].isoformat()
+                }
+                for slot in slots
+            ]
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -202,6 +692,7 @@ def complete_appointment(appointment_id):
         result = supabase.table('appointments').update(update_data).eq('id', appointment_id).execute()
         
         if result.data:
+            _appointments_changed(result.data[0], event='appointment.completed')
             return jsonify({
                 'message': 'Cita marcada como completada',
                 'appointment': result.data[0]
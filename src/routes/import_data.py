@@ -1,20 +1,89 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 import pandas as pd
-import os
 from datetime import datetime
 from ..config.supabase_client import get_supabase_client
 from ..utils.auth import token_required
+from ..utils.import_engine import (
+    IMPORT_CHUNK_SIZE, MAX_IMPORT_CHUNK_SIZE, NameLookup, distinct_names, fetch_ids_by_value, write_in_chunks
+)
+from ..utils.import_reader import count_rows, file_extension, read_sample, spool_upload
+from ..utils.import_parallel import iter_normalized_chunks
+from ..utils.import_jobs import get_job, submit_job
+from ..utils.import_checkpoints import ImportCheckpoint
+from ..utils.payment_rollups import record_payments
+from ..utils.calendar_cache import calendar_cache
+from ..utils.availability import availability_index
+from ..utils.patient_search import patient_search_index
+from ..utils.import_normalize import (
+    APPOINTMENT_REQUIRED, PATIENT_REQUIRED, PAYMENT_REQUIRED, infer_column_type, iter_records
+)
 import uuid
 
 import_bp = Blueprint('import', __name__)
 
-UPLOAD_FOLDER = '/tmp/uploads'
-ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv'}
+ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv', 'zip'}
+
+# Mapeo de columnas (basado en el archivo de pacientes analizado)
+PATIENT_COLUMNS = {
+    'NOMBRE COMPLETO': 'nombre_completo',
+    'TELEFONO': 'telefono',
+    'LOCALIDAD': 'localidad',
+    'ZONA DE TRATAMIENTO': 'zonas_tratamiento',
+    'FECHA DE NACIMIENTO': 'fecha_nacimiento',
+    'OBSERVACIONES': 'observaciones'
+}
+
+# Mapeo de columnas (basado en archivos de abonos/transferencias)
+PAYMENT_COLUMNS = {
+    'FECHA': 'fecha',
+    'PACIENTE': 'paciente',
+    'SERVICIO': 'servicio',
+    'MONTO': 'monto',
+    'METODO': 'metodo_pago',
+    'OBSERVACIONES': 'observaciones'
+}
+
+APPOINTMENT_COLUMNS = {
+    'FECHA': 'fecha',
+    'HORA': 'hora',
+    'PACIENTE': 'paciente',
+    'SERVICIO': 'servicio',
+    'SESION': 'numero_sesion',
+    'PRECIO': 'precio_sesion',
+    'ESTADO': 'status'
+}
+
+APPOINTMENT_STATUSES = {'agendada', 'confirmada', 'en_proceso', 'completada', 'cancelada', 'no_asistio'}
+
+MISSING_MESSAGES = {
+    'patients': 'Nombre completo requerido',
+    'payments': 'Paciente y monto son requeridos',
+    'appointments': 'Paciente y fecha son requeridos'
+}
+
+IMPORT_MAPPINGS = {
+    'patients': (PATIENT_COLUMNS, PATIENT_REQUIRED),
+    'payments': (PAYMENT_COLUMNS, PAYMENT_REQUIRED),
+    'appointments': (APPOINTMENT_COLUMNS, APPOINTMENT_REQUIRED)
+}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _form_flag(name):
+    return request.form.get(name, '').strip().lower() in ('1', 'true', 'si', 'sí')
+
+def _chunk_size():
+    """chunk_size del formulario o el de por defecto; ValueError si no está entre 1 y el máximo"""
+    value = request.form.get('chunk_size', '').strip()
+    if not value:
+        return IMPORT_CHUNK_SIZE
+    size = int(value) if value.isdigit() else 0
+    if not 1 <= size <= MAX_IMPORT_CHUNK_SIZE:
+        raise ValueError(f'chunk_size debe estar entre 1 y {MAX_IMPORT_CHUNK_SIZE}')
+    return size
+
 def clean_phone_number(phone):
     """Limpiar y formatear número de teléfono"""
     if pd.isna(phone):
@@ -42,94 +111,449 @@ def parse_date(date_value):
     
     return None
 
-@import_bp.route('/import/patients', methods=['POST'])
-@token_required
-def import_patients(current_user):
-    """Importar pacientes desde Excel"""
-    try:
-        if 'file' not in request.files:
-            return jsonify({'success': False, 'error': 'No se encontró archivo'}), 400
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'success': False, 'error': 'No se seleccionó archivo'}), 400
-        
-        if not allowed_file(file.filename):
-            return jsonify({'success': False, 'error': 'Formato de archivo no permitido'}), 400
+def _match_columns(columns, mapping, required):
+    """Comparar los encabezados del archivo con el column_mapping de un importador"""
+    matched = {column: mapping[column] for column in columns if column in mapping}
+    return {
+        'matched': matched,
+        'missing': [header for header in mapping if header not in matched],
+        'unmapped': [str(column) for column in columns if column not in mapping],
+        'missing_required': [
+            header for header, field in mapping.items() if field in required and header not in matched
+        ]
+    }
+
+def _patient_data(row, created_at):
+    """Preparar datos del paciente a partir de una fila normalizada"""
+    patient_data = {
+        'nombre_completo': row['nombre_completo'],
+        'telefono': row['telefono'],
+        'localidad': row['localidad'],
+        'fecha_nacimiento': row['fecha_nacimiento'],
+        'observaciones': row['observaciones'],
+        'created_at': created_at
+    }
+    
+    # Zonas de tratamiento solo si vienen en el archivo
+    if row['zonas_tratamiento'] is not None:
+        patient_data['zonas_tratamiento'] = row['zonas_tratamiento']
+    
+    return patient_data
+
+def _payment_data(row, patient_id, cashier_id, ticket_number=None):
+    """Preparar datos del pago a partir de una fila normalizada"""
+    return {
+        'patient_id': patient_id,
+        'total_amount': float(row['monto']),
+        'payment_method': row['metodo_pago'],
+        'ticket_number': ticket_number or f"IMP{datetime.now().strftime('%Y%m%d')}{str(uuid.uuid4())[:6].upper()}",
+        'cashier_id': cashier_id,
+        'created_at': row['fecha'] or datetime.now().isoformat(),
+        'is_imported': True,
+        'import_notes': row['observaciones']
+    }
+
+def _appointment_data(row, patient_id, service_id, created_at):
+    """Preparar datos de la cita a partir de una fila normalizada"""
+    return {
+        'patient_id': patient_id,
+        'service_id': service_id,
+        # Construir fecha y hora
+        'fecha_hora': f"{row['fecha']}T{row['hora']}:00",
+        'numero_sesion': int(row['numero_sesion']),
+        'precio_sesion': float(row['precio_sesion']) if row['precio_sesion'] is not None else None,
+        'status': row['status'],
+        'created_at': created_at,
+        'is_imported': True
+    }
+
+def _row_number(df, index):
+    """Número de fila en el archivo, con la hoja o archivo de origen si hay varios"""
+    source = df.attrs.get('source')
+    return f"{index + 2} ({source})" if source else index + 2
+
+def _new_result():
+    return {'imported_count': 0, 'total_rows': 0, 'errors': [], 'chunk_errors': []}
+
+def _add_write(result, written, errors, chunk_errors):
+    result['imported_count'] += written
+    result['errors'].extend(errors)
+    result['chunk_errors'].extend(chunk_errors)
+
+def _import_patients(supabase, chunks, chunk_size, progress=None, result=None):
+    """Importar pacientes bloque por bloque"""
+    result = result or _new_result()
+    known_patients = NameLookup(supabase, 'patients', 'nombre_completo')
+    
+    # Cada bloque llega ya normalizado (ver import_parallel.iter_normalized_chunks)
+    for normalized in chunks:
+        result['total_rows'] += len(normalized)
+        created_at = datetime.now().isoformat()
+        # Pacientes por nombre, en orden de aparición en el bloque
+        patients_by_name = {}
+        
+        for index, row in iter_records(normalized):
+            row_number = _row_number(normalized, index)
+            try:
+                # Validar datos requeridos
+                if row['missing']:
+                    result['errors'].append(f"Fila {row_number}: {MISSING_MESSAGES['patients']}")
+                    continue
+                
+                patient_data = _patient_data(row, created_at)
+                
+                # Filas repetidas del mismo paciente se combinan (la última gana)
+                record = patients_by_name.setdefault(patient_data['nombre_completo'], {'rows': [], 'data': {}})
+                record['rows'].append(row_number)
+                record['data'].update(patient_data)
+                
+            except Exception as e:
+                result['errors'].append(f"Fila {row_number}: {str(e)}")
+        
+        # Buscar los pacientes del bloque que ya existen (o que se crearon en bloques anteriores)
+        known_patients.load(list(patients_by_name))
+        
+        to_insert = []
+        to_update = []
+        for name, record in patients_by_name.items():
+            patient_id = known_patients.get(name)
+            if patient_id:
+                record['data']['id'] = patient_id
+                to_update.append(record)
+            else:
+                to_insert.append(record)
+        
+        written, created, errors, chunk_errors = write_in_chunks(
+            supabase, 'patients', to_insert, mode='insert', chunk_size=chunk_size
+        )
+        _add_write(result, written, errors, chunk_errors)
+        for patient in created:
+            known_patients.add(patient['nombre_completo'], patient['id'])
+        patient_search_index.apply_many(created)
+        
+        written, updated, errors, chunk_errors = write_in_chunks(
+            supabase, 'patients', to_update, mode='upsert', chunk_size=chunk_size
+        )
+        _add_write(result, written, errors, chunk_errors)
+        patient_search_index.apply_many(updated)
+        if progress:
+            progress(result)
+    
+    return result
+
+def _import_payments(supabase, chunks, chunk_size, current_user, progress=None, result=None, file_hash=None):
+    """Importar pagos bloque por bloque.
+    
+    Con file_hash el ticket se deriva del archivo y la fila, de modo que reintentar
+    el mismo archivo no duplica pagos.
+    """
+    result = result or _new_result()
+    patients = NameLookup(supabase, 'patients', 'nombre_completo')
+    
+    for normalized in chunks:
+        result['total_rows'] += len(normalized)
+        payments = []
         
-        # Guardar archivo temporalmente
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        
-        # Leer Excel
-        df = pd.read_excel(filepath)
-        
-        # Mapear columnas (basado en el archivo de pacientes analizado)
-        column_mapping = {
-            'NOMBRE COMPLETO': 'nombre_completo',
-            'TELEFONO': 'telefono',
-            'LOCALIDAD': 'localidad',
-            'ZONA DE TRATAMIENTO': 'zonas_tratamiento',
-            'FECHA DE NACIMIENTO': 'fecha_nacimiento',
-            'OBSERVACIONES': 'observaciones'
-        }
+        # Resolver una sola vez los pacientes referenciados en el bloque
+        patients.load(distinct_names(normalized, 'paciente'))
         
-        # Renombrar columnas
-        df_mapped = df.rename(columns=column_mapping)
+        for index, row in iter_records(normalized):
+            row_number = _row_number(normalized, index)
+            try:
+                # Validar datos requeridos
+                if row['missing']:
+                    result['errors'].append(f"Fila {row_number}: {MISSING_MESSAGES['payments']}")
+                    continue
+                
+                # Buscar paciente
+                patient_name = row['paciente']
+                patient_id = patients.get(patient_name)
+                
+                if not patient_id:
+                    result['errors'].append(f"Fila {row_number}: Paciente '{patient_name}' no encontrado")
+                    continue
+                
+                ticket_number = None
+                if file_hash:
+                    # En libros con varias hojas o zip, la parte (hoja/archivo) también identifica la fila
+                    part = normalized.attrs.get('part')
+                    part_key = f"{part:03d}" if part is not None else ''
+                    ticket_number = f"IMP{file_hash[:10].upper()}{part_key}{index + 2:07d}"
+                payment_data = _payment_data(row, patient_id, current_user['id'], ticket_number)
+                payments.append({'rows': [row_number], 'data': payment_data})
+                
+            except Exception as e:
+                result['errors'].append(f"Fila {row_number}: {str(e)}")
+        
+        # Insertar pagos por bloques
+        if file_hash:
+            written, created, errors, chunk_errors = write_in_chunks(
+                supabase, 'payments', payments, mode='upsert', chunk_size=chunk_size,
+                on_conflict='ticket_number', ignore_duplicates=True
+            )
+        else:
+            written, created, errors, chunk_errors = write_in_chunks(
+                supabase, 'payments', payments, chunk_size=chunk_size
+            )
+        _add_write(result, written, errors, chunk_errors)
+        
+        # Solo los pagos devueltos son nuevos (los duplicados ignorados no vuelven)
+        record_payments(supabase, created)
+        if progress:
+            progress(result)
+    
+    return result
+
+def _import_appointments(supabase, chunks, chunk_size, progress=None, result=None):
+    """Importar citas bloque por bloque"""
+    result = result or _new_result()
+    patients = NameLookup(supabase, 'patients', 'nombre_completo')
+    services = NameLookup(supabase, 'services', 'nombre')
+    
+    for normalized in chunks:
+        result['total_rows'] += len(normalized)
+        created_at = datetime.now().isoformat()
+        appointments = []
         
-        supabase = get_supabase_client()
-        imported_count = 0
-        errors = []
+        # Resolver una sola vez los pacientes y servicios referenciados en el bloque
+        patients.load(distinct_names(normalized, 'paciente'))
+        services.load(distinct_names(normalized, 'servicio'))
         
-        for index, row in df_mapped.iterrows():
+        for index, row in iter_records(normalized):
+            row_number = _row_number(normalized, index)
             try:
                 # Validar datos requeridos
-                if pd.isna(row.get('nombre_completo')):
-                    errors.append(f"Fila {index + 2}: Nombre completo requerido")
+                if row['missing']:
+                    result['errors'].append(f"Fila {row_number}: {MISSING_MESSAGES['appointments']}")
                     continue
                 
-                # Preparar datos del paciente
-                patient_data = {
-                    'nombre_completo': str(row['nombre_completo']).strip(),
-                    'telefono': clean_phone_number(row.get('telefono')),
-                    'localidad': str(row.get('localidad', '')).strip() if not pd.isna(row.get('localidad')) else None,
-                    'fecha_nacimiento': parse_date(row.get('fecha_nacimiento')),
-                    'observaciones': str(row.get('observaciones', '')).strip() if not pd.isna(row.get('observaciones')) else None,
-                    'created_at': datetime.now().isoformat()
-                }
+                # Buscar paciente
+                patient_name = row['paciente']
+                patient_id = patients.get(patient_name)
+                
+                if not patient_id:
+                    result['errors'].append(f"Fila {row_number}: Paciente '{patient_name}' no encontrado")
+                    continue
                 
-                # Procesar zonas de tratamiento
-                zonas = row.get('zonas_tratamiento')
-                if not pd.isna(zonas):
-                    zonas_list = [z.strip() for z in str(zonas).split(',')]
-                    patient_data['zonas_tratamiento'] = zonas_list
+                # Buscar servicio (usar servicio por defecto si no se encuentra)
+                service_id = None
+                if row['servicio'] is not None:
+                    service_id = services.get(row['servicio'])
                 
-                # Verificar si el paciente ya existe
-                existing = supabase.table('patients').select('id').eq('nombre_completo', patient_data['nombre_completo']).execute()
+                appointment_data = _appointment_data(row, patient_id, service_id, created_at)
+                appointments.append({'rows': [row_number], 'data': appointment_data})
+                
+            except Exception as e:
+                result['errors'].append(f"Fila {row_number}: {str(e)}")
+        
+        # Insertar citas por bloques
+        written, created, errors, chunk_errors = write_in_chunks(
+            supabase, 'appointments', appointments, chunk_size=chunk_size
+        )
+        _add_write(result, written, errors, chunk_errors)
+        calendar_cache.invalidate_appointments(created)
+        availability_index.apply_many(created)
+        if progress:
+            progress(result)
+    
+    return result
+
+def _duplicate_key(kind, row):
+    if kind == 'patients':
+        return row['nombre_completo']
+    if kind == 'payments':
+        return (row['paciente'], row['fecha'], str(row['monto']), row['metodo_pago'])
+    return (row['paciente'], row['fecha'], row['hora'], row['servicio'])
+
+# Lo que hace la importación con una fecha que no se puede interpretar
+INVALID_DATE_FALLBACKS = {
+    'patients': 'el paciente se importará sin fecha de nacimiento',
+    'payments': 'el pago se importará con la fecha de hoy'
+}
+
+def _dry_run(kind, supabase, chunks, progress=None):
+    """Validar el archivo completo sin escribir en la base de datos.
+    
+    Aplica las mismas reglas que la importación y resuelve pacientes y servicios
+    con una sola búsqueda por lotes al final.
+    """
+    result = _new_result()
+    result.update({'dry_run': True, 'valid_rows': 0, 'warnings': []})
+    errors = []
+    warnings = []
+    first_seen = {}
+    # Nombre -> filas que lo referencian, para resolverlos todos juntos
+    pending_patients = {}
+    pending_services = {}
+    created_at = datetime.now().isoformat()
+    
+    for normalized in chunks:
+        result['total_rows'] += len(normalized)
+        part = normalized.attrs.get('part', 0)
+        
+        for index, row in iter_records(normalized):
+            # (orden en el archivo, etiqueta) para ordenar el reporte al final
+            row_number = ((part, index), _row_number(normalized, index))
+            try:
+                # Validar datos requeridos
+                if row['missing']:
+                    errors.append((row_number, MISSING_MESSAGES[kind]))
+                    continue
                 
-                if existing.data:
-                    # Actualizar paciente existente
-                    supabase.table('patients').update(patient_data).eq('id', existing.data[0]['id']).execute()
+                if row['invalid_date'] is not None:
+                    message = f"Fecha '{row['invalid_date']}' no válida"
+                    # Pacientes y pagos se importan igual (sin fecha de nacimiento / con la fecha de hoy)
+                    if kind not in INVALID_DATE_FALLBACKS:
+                        errors.append((row_number, message))
+                        continue
+                    warnings.append((row_number, f"{message}, {INVALID_DATE_FALLBACKS[kind]}"))
+                
+                # Construir el registro igual que la importación para detectar montos y números inválidos
+                if kind == 'patients':
+                    _patient_data(row, created_at)
+                elif kind == 'payments':
+                    _payment_data(row, None, None)
+                else:
+                    _appointment_data(row, None, None, created_at)
+                    if row['status'] not in APPOINTMENT_STATUSES:
+                        errors.append((row_number, f"Estado '{row['status']}' no válido"))
+                        continue
+                
+                key = _duplicate_key(kind, row)
+                if key in first_seen:
+                    message = f"Fila duplicada (igual a la fila {first_seen[key][1]})"
+                    # Los pacientes repetidos se combinan; pagos y citas se crearían dos veces
+                    (warnings if kind == 'patients' else errors).append((row_number, message))
+                    if kind != 'patients':
+                        continue
                 else:
-                    # Crear nuevo paciente
-                    supabase.table('patients').insert(patient_data).execute()
+                    first_seen[key] = row_number
                 
-                imported_count += 1
+                if kind != 'patients':
+                    pending_patients.setdefault(row['paciente'], []).append(row_number)
+                if kind == 'appointments' and row['servicio'] is not None:
+                    pending_services.setdefault(row['servicio'], []).append(row_number)
                 
             except Exception as e:
-                errors.append(f"Fila {index + 2}: {str(e)}")
+                errors.append((row_number, str(e)))
+        
+        if progress:
+            progress(result)
+    
+    # Una sola búsqueda por lotes de los pacientes y servicios referenciados
+    if pending_patients:
+        found = fetch_ids_by_value(supabase, 'patients', 'nombre_completo', list(pending_patients))
+        for name, rows in pending_patients.items():
+            if name not in found:
+                errors.extend((row_number, f"Paciente '{name}' no encontrado") for row_number in rows)
+    if pending_services:
+        found = fetch_ids_by_value(supabase, 'services', 'nombre', list(pending_services))
+        for name, rows in pending_services.items():
+            if name not in found:
+                warnings.extend(
+                    (row_number, f"Servicio '{name}' no encontrado, la cita se importará sin servicio")
+                    for row_number in rows
+                )
+    
+    errors.sort(key=lambda error: error[0][0])
+    warnings.sort(key=lambda warning: warning[0][0])
+    result['errors'] = [f"Fila {label}: {message}" for (_, label), message in errors]
+    result['warnings'] = [f"Fila {label}: {message}" for (_, label), message in warnings]
+    result['valid_rows'] = result['total_rows'] - len({position for (position, _), _ in errors})
+    if progress:
+        progress(result)
+    return result
+
+# Importaciones que se pueden repetir sin duplicar (pacientes por nombre, pagos por ticket)
+RETRYABLE_IMPORTS = {'patients', 'payments'}
+
+def _run_import(kind, source, filename, chunk_size, current_user, file_hash, dry_run=False, job=None,
+                force=False):
+    """Ejecutar una importación (o su validación) sobre el archivo ya copiado a un temporal.
+    
+    force vuelve a importar un archivo aunque ya figure como completado.
+    """
+    supabase = get_supabase_client()
+    progress = job.progress if job else None
+    
+    mapping, _ = IMPORT_MAPPINGS[kind]
+    
+    def read_chunks(size):
+        chunks = iter_normalized_chunks(source, filename, kind, mapping, size)
+        return job.track(chunks) if job else chunks
+    
+    if dry_run:
+        return _dry_run(kind, supabase, read_chunks(chunk_size), progress=progress)
+    
+    # Un archivo ya importado devuelve el resultado anterior; uno incompleto continúa
+    checkpoint = ImportCheckpoint(supabase, file_hash, kind, chunk_size, current_user.get('id'))
+    # Con force, o si terminó con filas con error (p. ej. pagos antes que sus pacientes), se reprocesa
+    if force or checkpoint.status == 'completado_con_errores':
+        checkpoint.restart(chunk_size)
+    if checkpoint.completed:
+        result = {**checkpoint.result, 'file_hash': file_hash, 'already_imported': True}
+        if progress:
+            progress(result)
+        return result
+    
+    chunk_size = checkpoint.chunk_size
+    resumed = checkpoint.resumed
+    result = checkpoint.result if resumed else None
+    chunks = checkpoint.pending(read_chunks(chunk_size))
+    
+    def on_chunk(chunk_result):
+        checkpoint.commit(chunk_result)
+        if progress:
+            progress(chunk_result)
+    
+    if kind == 'patients':
+        result = _import_patients(supabase, chunks, chunk_size, progress=on_chunk, result=result)
+    elif kind == 'payments':
+        result = _import_payments(
+            supabase, chunks, chunk_size, current_user, progress=on_chunk, result=result, file_hash=file_hash
+        )
+    else:
+        result = _import_appointments(supabase, chunks, chunk_size, progress=on_chunk, result=result)
+    
+    if not (job and job.cancelled):
+        # Las citas se insertan sin clave natural: reintentarlas solas las duplicaría
+        checkpoint.finish(result, retryable=kind in RETRYABLE_IMPORTS)
+    return {**result, 'file_hash': file_hash, 'resumed': resumed}
+
+@import_bp.route('/import/patients', methods=['POST'])
+@token_required
+def import_patients(current_user):
+    """Importar pacientes desde Excel"""
+    try:
+        if 'file' not in request.files:
+            return jsonify({'success': False, 'error': 'No se encontró archivo'}), 400
         
-        # Limpiar archivo temporal
-        os.remove(filepath)
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'success': False, 'error': 'No se seleccionó archivo'}), 400
         
-        return jsonify({
-            'success': True,
-            'imported_count': imported_count,
-            'total_rows': len(df),
-            'errors': errors
-        })
+        if not allowed_file(file.filename):
+            return jsonify({'success': False, 'error': 'Formato de archivo no permitido'}), 400
+        
+        try:
+            chunk_size = _chunk_size()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        # Validar sin escribir en la base de datos
+        dry_run = _form_flag('dry_run')
+        # Reimportar aunque el archivo ya se haya importado
+        force = _form_flag('force')
+        
+        # Leer el archivo por bloques desde un temporal anónimo
+        source, file_hash = spool_upload(file)
+        try:
+            result = _run_import(
+                'patients', source, file.filename, chunk_size, current_user, file_hash, dry_run, force=force
+            )
+        finally:
+            source.close()
+        
+        return jsonify({'success': True, **result})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -146,76 +570,25 @@ def import_payments(current_user):
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'error': 'Formato de archivo no permitido'}), 400
         
-        # Guardar archivo temporalmente
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        
-        # Leer Excel
-        df = pd.read_excel(filepath)
-        
-        # Mapear columnas (basado en archivos de abonos/transferencias)
-        column_mapping = {
-            'FECHA': 'fecha',
-            'PACIENTE': 'paciente',
-            'SERVICIO': 'servicio',
-            'MONTO': 'monto',
-            'METODO': 'metodo_pago',
-            'OBSERVACIONES': 'observaciones'
-        }
-        
-        df_mapped = df.rename(columns=column_mapping)
-        
-        supabase = get_supabase_client()
-        imported_count = 0
-        errors = []
-        
-        for index, row in df_mapped.iterrows():
-            try:
-                # Validar datos requeridos
-                if pd.isna(row.get('paciente')) or pd.isna(row.get('monto')):
-                    errors.append(f"Fila {index + 2}: Paciente y monto son requeridos")
-                    continue
-                
-                # Buscar paciente
-                patient_name = str(row['paciente']).strip()
-                patient_result = supabase.table('patients').select('id').eq('nombre_completo', patient_name).execute()
-                
-                if not patient_result.data:
-                    errors.append(f"Fila {index + 2}: Paciente '{patient_name}' no encontrado")
-                    continue
-                
-                patient_id = patient_result.data[0]['id']
-                
-                # Preparar datos del pago
-                payment_data = {
-                    'patient_id': patient_id,
-                    'total_amount': float(row['monto']),
-                    'payment_method': str(row.get('metodo_pago', 'efectivo')).lower(),
-                    'ticket_number': f"IMP{datetime.now().strftime('%Y%m%d')}{str(uuid.uuid4())[:6].upper()}",
-                    'cashier_id': current_user['id'],
-                    'created_at': parse_date(row.get('fecha')) or datetime.now().isoformat(),
-                    'is_imported': True,
-                    'import_notes': str(row.get('observaciones', '')).strip() if not pd.isna(row.get('observaciones')) else None
-                }
-                
-                # Insertar pago
-                supabase.table('payments').insert(payment_data).execute()
-                imported_count += 1
-                
-            except Exception as e:
-                errors.append(f"Fila {index + 2}: {str(e)}")
-        
-        # Limpiar archivo temporal
-        os.remove(filepath)
-        
-        return jsonify({
-            'success': True,
-            'imported_count': imported_count,
-            'total_rows': len(df),
-            'errors': errors
-        })
+        try:
+            chunk_size = _chunk_size()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        # Validar sin escribir en la base de datos
+        dry_run = _form_flag('dry_run')
+        # Reimportar aunque el archivo ya se haya importado
+        force = _form_flag('force')
+        
+        # Leer el archivo por bloques desde un temporal anónimo
+        source, file_hash = spool_upload(file)
+        try:
+            result = _run_import(
+                'payments', source, file.filename, chunk_size, current_user, file_hash, dry_run, force=force
+            )
+        finally:
+            source.close()
+        
+        return jsonify({'success': True, **result})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -232,99 +605,86 @@ def import_appointments(current_user):
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'error': 'Formato de archivo no permitido'}), 400
         
-        # Guardar archivo temporalmente
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        
-        # Leer Excel
-        df = pd.read_excel(filepath)
-        
-        # Mapear columnas
-        column_mapping = {
-            'FECHA': 'fecha',
-            'HORA': 'hora',
-            'PACIENTE': 'paciente',
-            'SERVICIO': 'servicio',
-            'SESION': 'numero_sesion',
-            'PRECIO': 'precio_sesion',
-            'ESTADO': 'status'
-        }
+        try:
+            chunk_size = _chunk_size()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        # Validar sin escribir en la base de datos
+        dry_run = _form_flag('dry_run')
+        # Reimportar aunque el archivo ya se haya importado
+        force = _form_flag('force')
+        
+        # Leer el archivo por bloques desde un temporal anónimo
+        source, file_hash = spool_upload(file)
+        try:
+            result = _run_import(
+                'appointments', source, file.filename, chunk_size, current_user, file_hash, dry_run, force=force
+            )
+        finally:
+            source.close()
+        
+        return jsonify({'success': True, **result})
         
-        df_mapped = df.rename(columns=column_mapping)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@import_bp.route('/import/preview', methods=['POST'])
+@token_required
+def preview_import(current_user):
+    """Vista previa de archivo Excel antes de importar"""
+    try:
+        if 'file' not in request.files:
+            return jsonify({'success': False, 'error': 'No se encontró archivo'}), 400
         
-        supabase = get_supabase_client()
-        imported_count = 0
-        errors = []
+        file = request.files['file']
+        if not allowed_file(file.filename):
+            return jsonify({'success': False, 'error': 'Formato de archivo no permitido'}), 400
         
-        for index, row in df_mapped.iterrows():
-            try:
-                # Validar datos requeridos
-                if pd.isna(row.get('paciente')) or pd.isna(row.get('fecha')):
-                    errors.append(f"Fila {index + 2}: Paciente y fecha son requeridos")
-                    continue
-                
-                # Buscar paciente
-                patient_name = str(row['paciente']).strip()
-                patient_result = supabase.table('patients').select('id').eq('nombre_completo', patient_name).execute()
-                
-                if not patient_result.data:
-                    errors.append(f"Fila {index + 2}: Paciente '{patient_name}' no encontrado")
-                    continue
-                
-                patient_id = patient_result.data[0]['id']
-                
-                # Buscar servicio (usar servicio por defecto si no se encuentra)
-                service_id = None
-                if not pd.isna(row.get('servicio')):
-                    service_name = str(row['servicio']).strip()
-                    service_result = supabase.table('services').select('id').eq('nombre', service_name).execute()
-                    if service_result.data:
-                        service_id = service_result.data[0]['id']
-                
-                # Construir fecha y hora
-                fecha = parse_date(row['fecha'])
-                hora = str(row.get('hora', '10:00')).strip()
-                fecha_hora = f"{fecha}T{hora}:00"
-                
-                # Preparar datos de la cita
-                appointment_data = {
-                    'patient_id': patient_id,
-                    'service_id': service_id,
-                    'fecha_hora': fecha_hora,
-                    'numero_sesion': int(row.get('numero_sesion', 1)),
-                    'precio_sesion': float(row.get('precio_sesion', 0)) if not pd.isna(row.get('precio_sesion')) else None,
-                    'status': str(row.get('status', 'agendada')).lower(),
-                    'created_at': datetime.now().isoformat(),
-                    'is_imported': True
-                }
-                
-                # Insertar cita
-                supabase.table('appointments').insert(appointment_data).execute()
-                imported_count += 1
-                
-            except Exception as e:
-                errors.append(f"Fila {index + 2}: {str(e)}")
+        if file_extension(file.filename) == 'zip':
+            return jsonify({'success': False, 'error': 'La vista previa no admite archivos zip'}), 400
+        
+        source, _ = spool_upload(file)
+        try:
+            # Leer solo las primeras 10 filas; el total sale de los metadatos o del conteo de líneas
+            df = read_sample(source, file.filename, 10)
+            total_rows = count_rows(source, file.filename)
+        finally:
+            source.close()
         
-        # Limpiar archivo temporal
-        os.remove(filepath)
+        columns = df.columns.tolist()
+        
+        # Convertir a formato JSON serializable
+        preview_data = {
+            'columns': columns,
+            'rows': df.fillna('').to_dict('records'),
+            'total_rows': total_rows,
+            'filename': secure_filename(file.filename),
+            'column_types': {
+                str(column): infer_column_type(df[column]) for column in columns
+            },
+            'column_matches': {
+                kind: _match_columns(columns, mapping, required)
+                for kind, (mapping, required) in IMPORT_MAPPINGS.items()
+            }
+        }
         
         return jsonify({
             'success': True,
-            'imported_count': imported_count,
-            'total_rows': len(df),
-            'errors': errors
+            'preview': preview_data
         })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@import_bp.route('/import/preview', methods=['POST'])
+@import_bp.route('/jobs', methods=['POST'])
 @token_required
-def preview_import(current_user):
-    """Vista previa de archivo Excel antes de importar"""
+def submit_import_job(current_user):
+    """Encolar una importación en segundo plano y devolver el id del trabajo"""
     try:
+        kind = request.form.get('type')
+        if kind not in ('patients', 'payments', 'appointments'):
+            return jsonify({'success': False, 'error': 'Tipo de importación no válido'}), 400
+        
         if 'file' not in request.files:
             return jsonify({'success': False, 'error': 'No se encontró archivo'}), 400
         
@@ -332,31 +692,77 @@ def preview_import(current_user):
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'error': 'Formato de archivo no permitido'}), 400
         
-        # Guardar archivo temporalmente
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
+        try:
+            chunk_size = _chunk_size()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        dry_run = _form_flag('dry_run')
+        force = _form_flag('force')
+        filename = file.filename
+        # El temporal pertenece al trabajo; la petición puede terminar antes
+        source, file_hash = spool_upload(file)
+        
+        def run(job):
+            try:
+                _run_import(kind, source, filename, chunk_size, current_user, file_hash, dry_run, job=job, force=force)
+            finally:
+                source.close()
         
-        # Leer Excel (solo primeras 10 filas)
-        df = pd.read_excel(filepath, nrows=10)
+        job = submit_job(kind, secure_filename(filename), current_user.get('id'), run, get_supabase_client())
+        if not job:
+            source.close()
+            return jsonify({'success': False, 'error': 'Demasiadas importaciones en curso, intente más tarde'}), 429
         
-        # Convertir a formato JSON serializable
-        preview_data = {
-            'columns': df.columns.tolist(),
-            'rows': df.fillna('').to_dict('records'),
-            'total_rows': len(pd.read_excel(filepath)),
-            'filename': filename
-        }
+        return jsonify({
+            'success': True,
+            'job': job.to_dict()
+        }), 202
         
-        # Limpiar archivo temporal
-        os.remove(filepath)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _user_job(current_user, job_id):
+    """Trabajo si existe y el usuario puede verlo; los ajenos se reportan como inexistentes"""
+    job = get_job(job_id, get_supabase_client())
+    if job and job.visible_to(current_user.get('id'), request.user.get('role')):
+        return job
+    return None
+
+@import_bp.route('/jobs/<job_id>', methods=['GET'])
+@token_required
+def get_import_job(current_user, job_id):
+    """Consultar el progreso de una importación en segundo plano.
+    
+    Si la consulta llega a otro worker se devuelve el último estado guardado en import_jobs.
+    """
+    try:
+        job = _user_job(current_user, job_id)
+        if not job:
+            return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
         
         return jsonify({
             'success': True,
-            'preview': preview_data
+            'job': job.to_dict()
         })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@import_bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+@token_required
+def cancel_import_job(current_user, job_id):
+    """Cancelar una importación (se detiene al terminar el bloque en curso)"""
+    try:
+        job = _user_job(current_user, job_id)
+        if not job:
+            return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+        
+        job.cancel()
+        
+        return jsonify({
+            'success': True,
+            'job': job.to_dict()
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
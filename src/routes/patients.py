@@ -1,38 +1,109 @@
 from flask import Blueprint, request, jsonify
 from src.config.supabase_client import get_supabase_client
 from src.utils.auth import require_auth, require_role
+from src.utils.pagination import CountCache, decode_cursor, keyset_page, parse_count, parse_limit, split_page
+from src.utils.patient_search import patient_search_index
+from src.utils.projection import public_row, public_rows
+import os
 
 patients_bp = Blueprint('patients', __name__)
 
+# Orden estable para la paginación por cursor (el id desempata pacientes con el mismo nombre)
+PATIENT_SORT = ['nombre_completo', 'id']
+# Vida del total en caché (también cubre importaciones y altas en otros workers)
+PATIENT_COUNT_TTL = int(os.getenv('PATIENT_COUNT_TTL', 60))
+patient_counts = CountCache(PATIENT_COUNT_TTL)
+
+def _search_patients(supabase, search, offset, limit):
+    """Página de la búsqueda: el índice en memoria da los ids en orden de relevancia"""
+    patient_search_index.ensure(supabase)
+    wanted = offset + limit + 1
+    ids = patient_search_index.search(search, wanted)
+    if not ids:
+        # Un alta de otro worker puede no haber llegado aún con la lectura incremental
+        patient_search_index.lookup(supabase, search, wanted)
+        ids = patient_search_index.search(search, wanted)
+    ids = ids[offset:]
+    has_more = len(ids) > limit
+    ids = ids[:limit]
+    if not ids:
+        return [], False
+    result = supabase.table('patients').select('*').in_('id', ids).execute()
+    by_id = {patient['id']: public_row(patient) for patient in result.data}
+    return [by_id[patient_id] for patient_id in ids if patient_id in by_id], has_more
+
 @patients_bp.route('', methods=['GET'])
 @require_auth
 def get_patients():
-    """Obtener lista de pacientes"""
+    """Obtener lista de pacientes.
+    
+    Ordenada por (nombre_completo, id) con paginación por cursor: se envía el
+    next_cursor de la respuesta anterior como ?cursor=. Con ?count=exact|estimated
+    se incluye el total (guardado PATIENT_COUNT_TTL segundos). ?page= se conserva
+    para clientes anteriores; con ?search= los resultados van por relevancia y se
+    paginan con ?page=.
+    """
     try:
         supabase = get_supabase_client()
         if not supabase:
             return jsonify({'error': 'Error de configuración del servidor'}), 500
         
         # Parámetros de consulta
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 50))
+        cursor = request.args.get('cursor')
+        page = request.args.get('page')
         search = request.args.get('search', '')
-        
-        # Construir consulta
-        query = supabase.table('patients').select('*')
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            count = parse_count(request.args.get('count'))
+            page = int(page) if page else None
+            if cursor:
+                decode_cursor(cursor, PATIENT_SORT)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         if search:
-            query = query.or_(f'nombre_completo.ilike.%{search}%,telefono.ilike.%{search}%')
-        
-        # Aplicar paginación
-        offset = (page - 1) * limit
-        result = query.range(offset, offset + limit - 1).execute()
+            page = page or 1
+            patients, has_more = _search_patients(supabase, search, (page - 1) * limit, limit)
+            return jsonify({
+                'patients': patients,
+                'page': page,
+                'limit': limit,
+                'pagination': {'limit': limit, 'page': page, 'next_cursor': None, 'has_more': has_more}
+            })
+        
+        total = patient_counts.get(count) if count else None
+        # Sin total en caché se cuenta junto con la primera página; con cursor, en una consulta aparte
+        inline_count = count if count and total is None and not cursor else None
+        query = supabase.table('patients').select('*', count=inline_count)
+        
+        if page and not cursor:
+            query = query.order('nombre_completo').order('id')
+            result = query.range((page - 1) * limit, page * limit - 1).execute()
+            patients, next_cursor = public_rows(result.data), None
+        else:
+            result = keyset_page(query, PATIENT_SORT, cursor, limit, descending=False).execute()
+            patients, next_cursor = split_page(public_rows(result.data), PATIENT_SORT, limit)
+        
+        if inline_count:
+            total = result.count
+        elif count and total is None:
+            total = supabase.table('patients').select('id', count=count, head=True).execute().count
+        if count:
+            patient_counts.set(count, total)
+        
+        pagination = {
+            'limit': limit,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'total': total,
+            'count_method': count
+        }
+        response = {'patients': patients, 'limit': limit, 'pagination': pagination}
+        if page and not cursor:
+            response['page'] = pagination['page'] = page
+            pagination['has_more'] = len(patients) == limit
         
-        return jsonify({
-            'patients': result.data,
-            'page': page,
-            'limit': limit
-        })
+        return jsonify(response)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -77,9 +148,11 @@ def create_patient():
         result = supabase.table('patients').insert(patient_data).execute()
         
         if result.data:
+            patient_search_index.apply(result.data[0])
+            patient_counts.invalidate()
             return jsonify({
                 'message': 'Paciente creado exitosamente',
-                'patient': result.data[0]
+                'patient': public_row(result.data[0])
             }), 201
         else:
             return jsonify({'error': 'Error al crear paciente'}), 500
@@ -102,7 +175,7 @@ def get_patient(patient_id):
             return jsonify({'error': 'Paciente no encontrado'}), 404
         
         return jsonify({
-            'patient': result.data[0]
+            'patient': public_row(result.data[0])
         })
         
     except Exception as e:
@@ -142,9 +215,10 @@ def update_patient(patient_id):
             result = supabase.table('patients').update(update_data).eq('id', patient_id).execute()
             
             if result.data:
+                patient_search_index.apply(result.data[0])
                 return jsonify({
                     'message': 'Paciente actualizado exitosamente',
-                    'patient': result.data[0]
+                    'patient': public_row(result.data[0])
                 })
             else:
                 return jsonify({'error': 'Error al actualizar paciente'}), 500
@@ -1,89 +1,156 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from ..config.supabase_client import get_supabase_client
-from ..utils.auth import token_required
+from ..utils.auth import require_auth, require_role, token_required
+from ..utils.calendar_cache import calendar_cache
+from ..utils.events import appointment_event, get_event_bus
+from ..utils.payment_rollups import TOTAL_FIELDS, cashier_totals, daily_totals, rebuild_daily_totals
+from ..utils.projection import list_select, public_row, public_rows
+from ..utils.search import prefix_tsquery, ticket_term
+from ..utils.pagination import decode_cursor, keyset_page, parse_count, parse_limit, split_page
 from datetime import datetime, timedelta
+import csv
+import io
+import os
 import uuid
 
 payments_bp = Blueprint('payments', __name__)
 
+# Orden estable para la paginación por cursor (el id desempata pagos del mismo instante)
+PAYMENT_SORT = ['created_at', 'id']
+
+PAYMENT_LIST_SELECT = '''
+    *,
+    cashier:users!payments_cashier_id_fkey(id, full_name),
+    appointments:payment_appointments(
+        appointment_id,
+        amount,
+        appointments(
+            id,
+            patients(nombre_completo),
+            services(nombre, zona)
+        )
+    )
+'''
+
+# Columnas de la tabla de pagos en pantalla (view=summary)
+PAYMENT_SUMMARY_SELECT = '''
+    id, ticket_number, created_at, payment_method, total_amount, discount,
+    cashier:users!payments_cashier_id_fkey(full_name)
+'''
+
+def _apply_payment_filters(query, args):
+    """Filtros comunes del listado de pagos a partir del query string"""
+    date_from = args.get('date_from')
+    date_to = args.get('date_to')
+    payment_method = args.get('payment_method')
+    search = args.get('search', '')
+    
+    if date_from:
+        query = query.gte('created_at', f"{date_from}T00:00:00")
+    if date_to:
+        query = query.lte('created_at', f"{date_to}T23:59:59")
+    if payment_method:
+        query = query.eq('payment_method', payment_method)
+    if search and prefix_tsquery(search):
+        tsquery = prefix_tsquery(search)
+        ticket = ticket_term(search)
+        if ticket:
+            # Parte de un ticket (ABC123 en T20250101ABC123) o prefijo de paciente/teléfono (migración 008)
+            query = query.or_(f'search_vector.fts(simple)."{tsquery}",ticket_number.ilike."*{ticket}*"')
+        else:
+            # Nombre o teléfono del paciente y ticket, por prefijo sobre el índice GIN (migración 005)
+            query = query.text_search('search_vector', tsquery, options={'config': 'simple'})
+    return query
+
+def _payment_summary(payment):
+    """Agregar conteo de servicios y nombre del paciente al pago"""
+    payment_data = {
+        **payment,
+        'services_count': len(payment.get('appointments', [])),
+        'patient_name': None
+    }
+    
+    # Si solo hay un paciente, mostrar su nombre
+    if payment.get('appointments'):
+        patients = set()
+        for apt in payment['appointments']:
+            if apt.get('appointments', {}).get('patients'):
+                patients.add(apt['appointments']['patients']['nombre_completo'])
+        
+        if len(patients) == 1:
+            payment_data['patient_name'] = list(patients)[0]
+        elif len(patients) > 1:
+            payment_data['patient_name'] = f"{len(patients)} pacientes"
+    
+    return payment_data
+
 @payments_bp.route('/payments', methods=['GET'])
 @token_required
 def get_payments(current_user):
-    """Obtener lista de pagos con filtros"""
+    """Obtener lista de pagos con filtros.
+    
+    Paginación por cursor sobre (created_at, id): se envía el next_cursor de la
+    respuesta anterior como ?cursor=. Con ?count=exact|estimated se incluye el
+    total de pagos que cumplen los filtros. ?page= se conserva para clientes
+    anteriores (paginación por desplazamiento). ?view=summary o ?fields=a,b
+    devuelven solo esas columnas.
+    """
     try:
         supabase = get_supabase_client()
         
-        # Parámetros de filtro
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        payment_method = request.args.get('payment_method')
-        search = request.args.get('search', '')
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 50))
-        
-        # Construir query base
-        query = supabase.table('payments').select('''
-            *,
-            cashier:users!payments_cashier_id_fkey(id, full_name),
-            appointments:payment_appointments(
-                appointment_id,
-                amount,
-                appointments(
-                    id,
-                    patients(nombre_completo),
-                    services(nombre, zona)
-                )
+        cursor = request.args.get('cursor')
+        page = request.args.get('page')
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            count = parse_count(request.args.get('count'))
+            page = int(page) if page else None
+            if cursor:
+                decode_cursor(cursor, PAYMENT_SORT)
+            # fields= o view=summary: select reducido y sin procesamiento por pago
+            columns, lean = list_select(
+                request.args, PAYMENT_LIST_SELECT, PAYMENT_SUMMARY_SELECT, required=PAYMENT_SORT
             )
-        ''')
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        # Aplicar filtros
-        if date_from:
-            query = query.gte('created_at', f"{date_from}T00:00:00")
-        if date_to:
-            query = query.lte('created_at', f"{date_to}T23:59:59")
-        if payment_method:
-            query = query.eq('payment_method', payment_method)
-        if search:
-            # Buscar en número de ticket o nombre de paciente
-            query = query.or_(f"ticket_number.ilike.%{search}%")
+        # El total se calcula junto con la primera página; con cursor, en una consulta aparte
+        inline_count = count if not cursor else None
+        query = _apply_payment_filters(
+            supabase.table('payments').select(columns, count=inline_count), request.args
+        )
         
-        # Ordenar y paginar
-        query = query.order('created_at', desc=True)
-        query = query.range((page - 1) * limit, page * limit - 1)
+        if page and not cursor:
+            query = query.order('created_at', desc=True).order('id', desc=True)
+            result = query.range((page - 1) * limit, page * limit - 1).execute()
+            rows, next_cursor = result.data, None
+        else:
+            result = keyset_page(query, PAYMENT_SORT, cursor, limit).execute()
+            rows, next_cursor = split_page(result.data, PAYMENT_SORT, limit)
         
-        result = query.execute()
+        total = result.count if inline_count else None
+        if count and cursor:
+            total = _apply_payment_filters(
+                supabase.table('payments').select('id', count=count, head=True), request.args
+            ).execute().count
         
         # Procesar datos para agregar información adicional
-        payments = []
-        for payment in result.data:
-            payment_data = {
-                **payment,
-                'services_count': len(payment.get('appointments', [])),
-                'patient_name': None
-            }
-            
-            # Si solo hay un paciente, mostrar su nombre
-            if payment.get('appointments'):
-                patients = set()
-                for apt in payment['appointments']:
-                    if apt.get('appointments', {}).get('patients'):
-                        patients.add(apt['appointments']['patients']['nombre_completo'])
-                
-                if len(patients) == 1:
-                    payment_data['patient_name'] = list(patients)[0]
-                elif len(patients) > 1:
-                    payment_data['patient_name'] = f"{len(patients)} pacientes"
-            
-            payments.append(payment_data)
+        rows = public_rows(rows)
+        payments = rows if lean else [_payment_summary(payment) for payment in rows]
+        
+        pagination = {
+            'limit': limit,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'total': total,
+            'count_method': count
+        }
+        if page and not cursor:
+            pagination['page'] = page
         
         return jsonify({
             'success': True,
             'payments': payments,
-            'pagination': {
-                'page': page,
-                'limit': limit,
-                'total': len(result.data)
-            }
+            'pagination': pagination
         })
         
     except Exception as e:
@@ -100,26 +167,17 @@ def get_payment_stats(current_user):
         week_ago = today - timedelta(days=7)
         month_ago = today - timedelta(days=30)
         
-        # Pagos de hoy
-        today_result = supabase.table('payments').select('total_amount').gte(
-            'created_at', f"{today}T00:00:00"
-        ).lte('created_at', f"{today}T23:59:59").execute()
-        
-        # Pagos de la semana
-        week_result = supabase.table('payments').select('total_amount').gte(
-            'created_at', f"{week_ago}T00:00:00"
-        ).execute()
+        # Una fila por día, método y cajero en lugar de un monto por pago
+        totals = daily_totals(supabase, month_ago)
         
-        # Pagos del mes
-        month_result = supabase.table('payments').select('total_amount').gte(
-            'created_at', f"{month_ago}T00:00:00"
-        ).execute()
+        def total_since(day):
+            return sum(float(t['total_amount']) for t in totals if t['day'] >= str(day))
         
         stats = {
-            'total_today': sum(p['total_amount'] for p in today_result.data),
-            'count_today': len(today_result.data),
-            'total_week': sum(p['total_amount'] for p in week_result.data),
-            'total_month': sum(p['total_amount'] for p in month_result.data)
+            'total_today': total_since(today),
+            'count_today': sum(t['payments_count'] for t in totals if t['day'] == str(today)),
+            'total_week': total_since(week_ago),
+            'total_month': total_since(month_ago)
         }
         
         return jsonify({
@@ -130,6 +188,35 @@ def get_payment_stats(current_user):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@payments_bp.route('/payments/stats/rebuild', methods=['POST'])
+@require_auth
+@require_role(['administrador'])
+def rebuild_payment_stats():
+    """Recalcular los totales diarios desde el historial de pagos"""
+    try:
+        data = request.get_json(silent=True) or {}
+        supabase = get_supabase_client()
+        
+        # Sin fechas se recalcula todo el historial
+        rebuilt = rebuild_daily_totals(supabase, data.get('date_from'), data.get('date_to'))
+        
+        return jsonify({
+            'success': True,
+            'rebuilt_groups': rebuilt
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _appointments_paid(appointments):
+    """Avisar a los calendarios de las citas que quedaron pagadas (el pago ya está guardado)"""
+    try:
+        calendar_cache.invalidate_appointments(appointments)
+        for appointment in appointments:
+            get_event_bus().publish(appointment_event('appointment.paid', appointment))
+    except Exception as e:
+        print(f"Warning: no se notificaron las citas pagadas: {e}")
+
 @payments_bp.route('/payments/process', methods=['POST'])
 @token_required
 def process_payment(current_user):
@@ -157,26 +244,19 @@ def process_payment(current_user):
             'created_at': datetime.now().isoformat()
         }
         
-        payment_result = supabase.table('payments').insert(payment_data).execute()
-        payment_id = payment_result.data[0]['id']
-        
-        # Crear registros de payment_appointments
-        appointment_payments = []
-        for apt in data['appointments']:
-            appointment_payments.append({
-                'payment_id': payment_id,
-                'appointment_id': apt['appointment_id'],
-                'amount': apt['amount']
-            })
-        
-        supabase.table('payment_appointments').insert(appointment_payments).execute()
+        appointment_payments = [
+            {'appointment_id': apt['appointment_id'], 'amount': apt['amount']}
+            for apt in data['appointments']
+        ]
         
-        # Actualizar las citas como pagadas
-        for apt in data['appointments']:
-            supabase.table('appointments').update({
-                'is_paid': True,
-                'metodo_pago': data['payment_method']
-            }).eq('id', apt['appointment_id']).execute()
+        # Pago, citas pagadas y totales diarios en una sola transacción; devuelve
+        # el id del pago y las citas pagadas (ver migración 009)
+        payment_result = supabase.rpc('process_payment', {
+            'p_payment': payment_data,
+            'p_appointments': appointment_payments
+        }).execute()
+        payment_id = payment_result.data['payment_id']
+        _appointments_paid(payment_result.data['appointments'])
         
         return jsonify({
             'success': True,
@@ -188,6 +268,130 @@ def process_payment(current_user):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _close_of_day(supabase, day, cashier_id=None):
+    """Corte de caja del día por cajero: congelado si ya se cerró, si no desde los totales diarios"""
+    live = cashier_totals(daily_totals(supabase, day, day, cashier_id))
+    
+    query = supabase.table('cash_closes').select('*').eq('day', day)
+    if cashier_id:
+        query = query.eq('cashier_id', cashier_id)
+    closes = {close['cashier_id']: close for close in query.execute().data}
+    
+    cashier_ids = [cid for cid in dict.fromkeys([*closes, *live]) if cid]
+    names = {}
+    if cashier_ids:
+        users = supabase.table('users').select('id, full_name').in_('id', cashier_ids).execute()
+        names = {user['id']: user['full_name'] for user in users.data}
+    
+    cashiers = []
+    for cid in dict.fromkeys([*closes, *live]):
+        close = closes.get(cid)
+        cashiers.append({
+            'cashier_id': cid,
+            'cashier_name': names.get(cid, 'Sistema'),
+            'closed': close is not None,
+            'closed_at': close['closed_at'] if close else None,
+            **(close['totals'] if close else live[cid])
+        })
+    return cashiers
+
+@payments_bp.route('/payments/close-of-day', methods=['GET'])
+@token_required
+def get_close_of_day(current_user):
+    """Corte de caja por cajero y método de pago (incluye descuentos y cambio)"""
+    try:
+        supabase = get_supabase_client()
+        day = request.args.get('date') or str(datetime.now().date())
+        if not _valid_day(day):
+            return jsonify({'success': False, 'error': 'Fecha inválida, use YYYY-MM-DD'}), 400
+        
+        return jsonify({
+            'success': True,
+            'date': day,
+            'cashiers': _close_of_day(supabase, day, request.args.get('cashier_id'))
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _valid_day(day):
+    try:
+        datetime.strptime(day, '%Y-%m-%d')
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def _is_admin():
+    return request.user.get('role') == 'administrador'
+
+@payments_bp.route('/payments/close-of-day', methods=['POST'])
+@token_required
+@require_role(['administrador', 'cajero'])
+def close_day(current_user):
+    """Cerrar el día de un cajero guardando sus totales como corte congelado.
+    
+    Un cajero solo cierra su propio día; el administrador puede indicar cashier_id.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        supabase = get_supabase_client()
+        day = data.get('date') or str(datetime.now().date())
+        if not _valid_day(day):
+            return jsonify({'success': False, 'error': 'Fecha inválida, use YYYY-MM-DD'}), 400
+        cashier_id = data.get('cashier_id') or current_user['id']
+        if cashier_id != current_user['id'] and not _is_admin():
+            return jsonify({'success': False, 'error': 'Solo un administrador puede cerrar el día de otro cajero'}), 403
+        
+        existing = supabase.table('cash_closes').select('*').eq('day', day).eq('cashier_id', cashier_id).execute()
+        if existing.data:
+            return jsonify({'success': False, 'error': 'El día ya está cerrado para este cajero'}), 409
+        
+        totals = cashier_totals(daily_totals(supabase, day, day, cashier_id)).get(cashier_id, {
+            'methods': {},
+            'totals': dict.fromkeys(TOTAL_FIELDS, 0)
+        })
+        supabase.table('cash_closes').insert({
+            'day': day,
+            'cashier_id': cashier_id,
+            'totals': totals,
+            'closed_by': current_user['id'],
+            'closed_at': datetime.now().isoformat()
+        }).execute()
+        
+        return jsonify({
+            'success': True,
+            'date': day,
+            'cashiers': _close_of_day(supabase, day, cashier_id)
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@payments_bp.route('/payments/close-of-day', methods=['DELETE'])
+@token_required
+@require_role(['administrador'])
+def reopen_day(current_user):
+    """Reabrir un día cerrado (borra el corte congelado; los totales vuelven a ser en vivo)"""
+    try:
+        supabase = get_supabase_client()
+        day = request.args.get('date')
+        cashier_id = request.args.get('cashier_id')
+        if not _valid_day(day) or not cashier_id:
+            return jsonify({'success': False, 'error': 'date (YYYY-MM-DD) y cashier_id son requeridos'}), 400
+        
+        result = supabase.table('cash_closes').delete().eq('day', day).eq('cashier_id', cashier_id).execute()
+        if not result.data:
+            return jsonify({'success': False, 'error': 'El día no está cerrado para este cajero'}), 404
+        
+        return jsonify({
+            'success': True,
+            'date': day,
+            'cashiers': _close_of_day(supabase, day, cashier_id)
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @payments_bp.route('/payments/<payment_id>', methods=['GET'])
 @token_required
 def get_payment(current_user, payment_id):
@@ -217,98 +421,112 @@ def get_payment(current_user, payment_id):
         
         return jsonify({
             'success': True,
-            'payment': result.data[0]
+            'payment': public_row(result.data[0])
         })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Pagos por consulta al exportar: la memoria depende de la página, no del rango
+EXPORT_PAGE_SIZE = int(os.getenv('PAYMENTS_EXPORT_PAGE_SIZE', 500))
+
+EXPORT_SELECT = '''
+    *,
+    cashier:users!payments_cashier_id_fkey(full_name),
+    appointments:payment_appointments(
+        appointments(
+            patients(nombre_completo),
+            services(nombre, zona)
+        )
+    )
+'''
+
+EXPORT_HEADERS = [
+    'Ticket', 'Fecha', 'Hora', 'Paciente', 'Servicios',
+    'Método Pago', 'Subtotal', 'Descuento', 'Total', 'Cajero'
+]
+
+def _export_row(payment):
+    """Fila del CSV de exportación para un pago"""
+    created_at = datetime.fromisoformat(payment['created_at'].replace('Z', '+00:00'))
+    
+    # Obtener información de pacientes y servicios
+    patients = set()
+    services = []
+    for apt in payment.get('appointments', []):
+        if apt.get('appointments'):
+            apt_data = apt['appointments']
+            if apt_data.get('patients'):
+                patients.add(apt_data['patients']['nombre_completo'])
+            if apt_data.get('services'):
+                services.append(apt_data['services']['nombre'])
+    
+    patient_names = ', '.join(patients) if patients else 'N/A'
+    service_names = ', '.join(services) if services else 'N/A'
+    
+    return [
+        payment.get('ticket_number', payment['id']),
+        created_at.strftime('%Y-%m-%d'),
+        created_at.strftime('%H:%M'),
+        patient_names,
+        service_names,
+        payment['payment_method'],
+        payment['total_amount'] + payment.get('discount', 0),
+        payment.get('discount', 0),
+        payment['total_amount'],
+        payment.get('cashier', {}).get('full_name', 'Sistema')
+    ]
+
+def _export_page(supabase, args, cursor):
+    """Una página de pagos para exportar y el cursor de la siguiente"""
+    # Mismos filtros que el listado (fechas, método de pago y búsqueda)
+    query = _apply_payment_filters(supabase.table('payments').select(EXPORT_SELECT), args)
+    result = keyset_page(query, PAYMENT_SORT, cursor, EXPORT_PAGE_SIZE).execute()
+    return split_page(result.data, PAYMENT_SORT, EXPORT_PAGE_SIZE)
+
+def _csv_line(writer, buffer, row):
+    writer.writerow(row)
+    line = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+    return line
+
 @payments_bp.route('/payments/export', methods=['GET'])
 @token_required
 def export_payments(current_user):
-    """Exportar pagos a CSV"""
+    """Exportar pagos a CSV en flujo, página por página.
+    
+    Acepta los filtros del listado. Si una página falla a mitad del envío, la
+    última línea del archivo es ERROR con el motivo.
+    """
     try:
-        # Obtener filtros
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        payment_method = request.args.get('payment_method')
-        
+        args = request.args.to_dict()
         supabase = get_supabase_client()
         
-        query = supabase.table('payments').select('''
-            *,
-            cashier:users!payments_cashier_id_fkey(full_name),
-            appointments:payment_appointments(
-                appointments(
-                    patients(nombre_completo),
-                    services(nombre, zona)
-                )
-            )
-        ''')
-        
-        # Aplicar filtros
-        if date_from:
-            query = query.gte('created_at', f"{date_from}T00:00:00")
-        if date_to:
-            query = query.lte('created_at', f"{date_to}T23:59:59")
-        if payment_method:
-            query = query.eq('payment_method', payment_method)
-        
-        result = query.execute()
-        
-        # Generar CSV
-        import csv
-        import io
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Headers
-        writer.writerow([
-            'Ticket', 'Fecha', 'Hora', 'Paciente', 'Servicios', 
-            'Método Pago', 'Subtotal', 'Descuento', 'Total', 'Cajero'
-        ])
-        
-        # Datos
-        for payment in result.data:
-            created_at = datetime.fromisoformat(payment['created_at'].replace('Z', '+00:00'))
-            
-            # Obtener información de pacientes y servicios
-            patients = set()
-            services = []
-            for apt in payment.get('appointments', []):
-                if apt.get('appointments'):
-                    apt_data = apt['appointments']
-                    if apt_data.get('patients'):
-                        patients.add(apt_data['patients']['nombre_completo'])
-                    if apt_data.get('services'):
-                        services.append(apt_data['services']['nombre'])
-            
-            patient_names = ', '.join(patients) if patients else 'N/A'
-            service_names = ', '.join(services) if services else 'N/A'
-            
-            writer.writerow([
-                payment.get('ticket_number', payment['id']),
-                created_at.strftime('%Y-%m-%d'),
-                created_at.strftime('%H:%M'),
-                patient_names,
-                service_names,
-                payment['payment_method'],
-                payment['total_amount'] + payment.get('discount', 0),
-                payment.get('discount', 0),
-                payment['total_amount'],
-                payment.get('cashier', {}).get('full_name', 'Sistema')
-            ])
-        
-        output.seek(0)
-        
-        from flask import Response
+        # La primera página se consulta antes de responder para poder devolver errores como JSON
+        first_page = _export_page(supabase, args, None)
+        
+        def generate(page, next_cursor):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            yield _csv_line(writer, buffer, EXPORT_HEADERS)
+            try:
+                while True:
+                    for payment in page:
+                        yield _csv_line(writer, buffer, _export_row(payment))
+                    if not next_cursor:
+                        break
+                    page, next_cursor = _export_page(supabase, args, next_cursor)
+            except Exception as e:
+                # El estado 200 ya se envió: se deja constancia al final del archivo
+                print(f"Error: exportación de pagos incompleta: {e}")
+                yield _csv_line(writer, buffer, ['ERROR', f'Exportación incompleta: {e}'])
+        
         return Response(
-            output.getvalue(),
+            stream_with_context(generate(*first_page)),
             mimetype='text/csv',
             headers={'Content-Disposition': f'attachment; filename=pagos_{datetime.now().strftime("%Y%m%d")}.csv'}
         )
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
-
@@ -54,6 +54,33 @@ def require_auth(f):
     
     return decorated_function
 
+def require_stream_auth(f):
+    """require_auth that also accepts the token as ?access_token= or an access_token cookie.
+
+    EventSource in the browser cannot send an Authorization header.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = (
+            request.headers.get('Authorization')
+            or request.args.get('access_token')
+            or request.cookies.get('access_token')
+        )
+        if not token:
+            return jsonify({'error': 'Token is missing'}), 401
+        
+        if token.startswith('Bearer '):
+            token = token[7:]
+        
+        payload = decode_token(token)
+        if not payload:
+            return jsonify({'error': 'Token is invalid or expired'}), 401
+        
+        request.user = payload
+        return f(*args, **kwargs)
+    
+    return decorated_function
+
 def token_required(f):
     """Decorator to require authentication (alias for require_auth)"""
     @wraps(f)
@@ -69,6 +96,9 @@ def token_required(f):
         if not payload:
             return jsonify({'error': 'Token is invalid or expired'}), 401
         
+        # Rol del token disponible como en require_auth (el registro de users solo trae role_id)
+        request.user = payload
+        
         # Obtener información completa del usuario
         try:
             supabase = get_supabase_client()
@@ -0,0 +1,195 @@
+import bisect
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .pagination import LOAD_PAGE_SIZE, keyset_page, split_page
+
+# Horario de la agenda y tamaño de los huecos sugeridos
+AGENDA_OPENING = os.getenv('AGENDA_OPENING', '09:00')
+AGENDA_CLOSING = os.getenv('AGENDA_CLOSING', '19:00')
+AGENDA_SLOT_MINUTES = int(os.getenv('AGENDA_SLOT_MINUTES', 15))
+# Días sin servicio (0 = lunes ... 6 = domingo)
+AGENDA_CLOSED_WEEKDAYS = {int(day) for day in os.getenv('AGENDA_CLOSED_WEEKDAYS', '6').split(',') if day.strip()}
+# Los días cargados se vuelven a leer pasado este tiempo (cambios de otros workers)
+AVAILABILITY_TTL = int(os.getenv('AVAILABILITY_TTL', 300))
+DEFAULT_DURATION = 30
+
+# Estados que no ocupan a la operadora
+FREE_STATUSES = {'cancelada'}
+
+def parse_fecha_hora(value):
+    """datetime sin zona horaria a partir de fecha_hora (como se guarda en la agenda)"""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+
+def _clock(value):
+    hours, minutes = value.split(':')
+    return timedelta(hours=int(hours), minutes=int(minutes))
+
+def booking_interval(appointment):
+    """(inicio, fin) de la cita según fecha_hora y duracion_minutos"""
+    start = parse_fecha_hora(appointment['fecha_hora'])
+    duration = appointment.get('duracion_minutos') or DEFAULT_DURATION
+    return start, start + timedelta(minutes=int(duration))
+
+def blocks_agenda(appointment):
+    """Si la cita ocupa el horario de su operadora"""
+    return bool(
+        appointment.get('operadora_id') and appointment.get('fecha_hora')
+        and appointment.get('status') not in FREE_STATUSES
+    )
+
+class AvailabilityIndex:
+    """Índice de intervalos ocupados por operadora y día para buscar huecos libres.
+
+    Los días se cargan de Supabase la primera vez que se consultan y las
+    escrituras de citas de este proceso los actualizan al momento. Puede no
+    ver las escrituras de otros workers hasta AVAILABILITY_TTL, por eso los
+    cruces al reservar se revisan con operadora_bookings y, en la base, con
+    el trigger de la migración 011.
+    """
+
+    def __init__(self, ttl=AVAILABILITY_TTL):
+        self.ttl = ttl
+        # (operadora_id, día) -> [(inicio, fin, id)] ordenado por inicio
+        self._schedules = {}
+        self._by_id = {}
+        self._loaded = {}
+        self._lock = threading.RLock()
+
+    def _remove(self, appointment_id):
+        entry = self._by_id.pop(appointment_id, None)
+        if entry:
+            key, interval = entry
+            self._schedules[key].remove(interval)
+
+    def _add(self, appointment):
+        start, end = booking_interval(appointment)
+        key = (appointment['operadora_id'], start.date())
+        interval = (start, end, appointment['id'])
+        bisect.insort(self._schedules.setdefault(key, []), interval)
+        self._by_id[appointment['id']] = (key, interval)
+
+    def apply(self, appointment):
+        """Reflejar una cita creada o actualizada"""
+        with self._lock:
+            self._remove(appointment['id'])
+            if blocks_agenda(appointment):
+                self._add(appointment)
+
+    def apply_many(self, appointments):
+        for appointment in appointments:
+            self.apply(appointment)
+
+    def _stale_days(self, first, last):
+        now = time.monotonic()
+        days = []
+        day = first
+        while day <= last:
+            loaded_at = self._loaded.get(day)
+            if loaded_at is None or now - loaded_at >= self.ttl:
+                days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    def ensure(self, supabase, first, last):
+        """Cargar (o recargar) los días del rango que falten con una consulta paginada"""
+        with self._lock:
+            stale = self._stale_days(first, last)
+        if not stale:
+            return
+        start, end = stale[0], stale[-1]
+        rows = _fetch_bookings(supabase, start, end)
+        with self._lock:
+            for appointment_id, (key, _) in list(self._by_id.items()):
+                if start <= key[1] <= end:
+                    self._remove(appointment_id)
+            for appointment in rows:
+                self._add(appointment)
+            loaded_at = time.monotonic()
+            day = start
+            while day <= end:
+                self._loaded[day] = loaded_at
+                day += timedelta(days=1)
+
+    def busy(self, operadora_id, day):
+        with self._lock:
+            return list(self._schedules.get((operadora_id, day), []))
+
+    def free_slots(self, operadora_ids, duration, first, days, count, not_before=None):
+        """Primeros count huecos libres de duration minutos entre las operadoras dadas"""
+        length = timedelta(minutes=duration)
+        step = timedelta(minutes=AGENDA_SLOT_MINUTES)
+        slots = []
+        for offset in range(days):
+            day = first + timedelta(days=offset)
+            if day.weekday() in AGENDA_CLOSED_WEEKDAYS:
+                continue
+            opening = datetime.combine(day, datetime.min.time()) + _clock(AGENDA_OPENING)
+            closing = datetime.combine(day, datetime.min.time()) + _clock(AGENDA_CLOSING)
+            day_slots = []
+            for operadora_id in operadora_ids:
+                day_slots.extend(
+                    (start, operadora_id)
+                    for start in _gaps(self.busy(operadora_id, day), opening, closing, length, step, not_before)
+                )
+            for start, operadora_id in sorted(day_slots, key=lambda slot: slot[0]):
+                slots.append({'operadora_id': operadora_id, 'start': start, 'end': start + length})
+                if len(slots) >= count:
+                    return slots
+        return slots
+
+def _gaps(busy, opening, closing, length, step, not_before=None):
+    """Inicios posibles (múltiplos de step desde la apertura) que no chocan con busy"""
+    candidate = opening
+    if not_before and not_before > candidate:
+        # Redondear hacia arriba al siguiente múltiplo de step
+        elapsed = not_before - opening
+        candidate = opening + step * -(-elapsed // step)
+    for busy_start, busy_end, _ in busy + [(closing, closing, None)]:
+        while candidate + length <= min(busy_start, closing):
+            yield candidate
+            candidate += step
+        if busy_end > candidate:
+            candidate = opening + step * -(-(busy_end - opening) // step)
+
+def _fetch_bookings(supabase, first, last, operadora_id=None):
+    """Citas con operadora de los días [first, last] en páginas por (fecha_hora, id)"""
+    columns = ['fecha_hora', 'id']
+    rows = []
+    cursor = None
+    while True:
+        query = supabase.table('appointments').select(
+            'id, operadora_id, fecha_hora, duracion_minutos, status'
+        ).gte('fecha_hora', f'{first} 00:00:00').lte('fecha_hora', f'{last} 23:59:59').neq('status', 'cancelada')
+        if operadora_id:
+            query = query.eq('operadora_id', operadora_id)
+        else:
+            query = query.not_.is_('operadora_id', 'null')
+        page, cursor = split_page(
+            keyset_page(query, columns, cursor, LOAD_PAGE_SIZE, descending=False).execute().data,
+            columns, LOAD_PAGE_SIZE
+        )
+        rows.extend(page)
+        if not cursor:
+            return rows
+
+def operadora_bookings(supabase, operadora_id, first, last):
+    """Citas vigentes de una operadora en los días [first, last], leídas de la base (sin índice)"""
+    return _fetch_bookings(supabase, first, last, operadora_id)
+
+def overlapping_booking(bookings, appointment, exclude_id=None):
+    """Id de la cita de bookings que se cruza con appointment, o None"""
+    start, end = booking_interval(appointment)
+    for booking in bookings:
+        if str(booking['id']) == str(exclude_id):
+            continue
+        busy_start, busy_end = booking_interval(booking)
+        if busy_start < end and busy_end > start:
+            return booking['id']
+    return None
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Los cambios hechos fuera de este proceso (otros workers o la base directamente)
+# solo se ven al vencer la entrada, por eso el TTL es de pocos segundos
+CALENDAR_CACHE_TTL = int(os.getenv('CALENDAR_CACHE_TTL', 5))
+# Días guardados como máximo; se descartan los menos recientes
+CALENDAR_CACHE_MAX_DAYS = int(os.getenv('CALENDAR_CACHE_MAX_DAYS', 400))
+
+def appointment_date(appointment):
+    """Día (YYYY-MM-DD) de una cita a partir de su fecha_hora"""
+    fecha_hora = appointment.get('fecha_hora') if appointment else None
+    return str(fecha_hora)[:10] if fecha_hora else None
+
+class CalendarCache:
+    """Respuestas de /calendar por día con su ETag.
+
+    Cada escritura invalida los días que toca. La generación tomada antes de
+    consultar evita guardar una consulta que empezó antes de una invalidación.
+    Entradas e invalidaciones se limitan a max_days días.
+    """
+
+    def __init__(self, ttl=CALENDAR_CACHE_TTL, max_days=CALENDAR_CACHE_MAX_DAYS):
+        self.ttl = ttl
+        self.max_days = max_days
+        self._entries = OrderedDict()
+        # Día -> generación de su última invalidación
+        self._invalidated = OrderedDict()
+        self._clock = 0
+        # Generación más alta entre las invalidaciones ya descartadas
+        self._floor = 0
+        self._lock = threading.Lock()
+
+    def generation(self, day):
+        with self._lock:
+            return self._clock
+
+    def get(self, day):
+        """(etag, payload) vigente del día o None"""
+        with self._lock:
+            entry = self._entries.get(day)
+            if entry and time.monotonic() - entry[2] < self.ttl:
+                return entry[0], entry[1]
+            self._entries.pop(day, None)
+            return None
+
+    def set(self, day, payload, generation):
+        """Guardar el día si no se invalidó mientras se consultaba; devuelve el ETag"""
+        etag = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            if max(self._floor, self._invalidated.get(day, 0)) <= generation:
+                self._entries[day] = (etag, payload, now)
+                self._entries.move_to_end(day)
+            # Las entradas quedan en orden de guardado: se podan vencidas y sobrantes
+            while self._entries:
+                oldest = next(iter(self._entries.values()))
+                if len(self._entries) <= self.max_days and now - oldest[2] < self.ttl:
+                    break
+                self._entries.popitem(last=False)
+        return etag
+
+    def invalidate(self, *days):
+        with self._lock:
+            self._clock += 1
+            for day in set(days):
+                if day:
+                    self._entries.pop(day, None)
+                    self._invalidated[day] = self._clock
+                    self._invalidated.move_to_end(day)
+            while len(self._invalidated) > self.max_days:
+                _, generation = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, generation)
+
+    def invalidate_appointments(self, appointments):
+        """Invalidar los días de una lista de citas (nuevas o con su fecha anterior)"""
+        self.invalidate(*(appointment_date(appointment) for appointment in appointments))
+
+calendar_cache = CalendarCache()
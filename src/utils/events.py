@@ -0,0 +1,157 @@
+import importlib
+import os
+import queue
+import threading
+import uuid
+from collections import deque
+
+from .calendar_cache import appointment_date
+
+# Eventos por suscriptor sin leer antes de pedirle que recargue
+EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', 256))
+# Eventos recientes que se reenvían al reconectar con Last-Event-ID
+EVENT_HISTORY_SIZE = int(os.getenv('EVENT_HISTORY_SIZE', 1024))
+
+def appointment_event(kind, *appointments):
+    """Evento de cambio de cita a partir de sus versiones (anterior y vigente).
+
+    Lleva todos los días y operadoras que tocó, para que una pantalla que
+    muestra el día anterior también se entere de que la cita se movió.
+    """
+    appointments = [appointment for appointment in appointments if appointment]
+    current = appointments[-1]
+    return {
+        'type': kind,
+        'appointment_id': current.get('id'),
+        'dates': sorted({appointment_date(appointment) for appointment in appointments} - {None}),
+        'operadora_ids': sorted(
+            {appointment.get('operadora_id') for appointment in appointments} - {None}, key=str
+        ),
+        'fecha_hora': current.get('fecha_hora'),
+        'status': current.get('status'),
+        'is_paid': current.get('is_paid')
+    }
+
+class Subscription:
+    """Cola de eventos de un cliente conectado"""
+
+    def __init__(self, bus, matches=None, max_size=EVENT_QUEUE_SIZE):
+        self.bus = bus
+        self.matches = matches
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=max_size)
+
+    def offer(self, event):
+        if self.matches and not self.matches(event):
+            return
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Cliente lento: se descartan eventos y se le pide recargar
+            self.overflowed = True
+
+    def get(self, timeout=None):
+        """Siguiente evento o None si no llegó ninguno en timeout segundos"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class EventBus:
+    """Bus de eventos en proceso (sin broker externo).
+
+    Cada evento publicado recibe un id '<instancia>-<n>' creciente y se copia a
+    la cola de cada suscriptor cuyo filtro lo acepta. Solo ve las escrituras de
+    este proceso, por eso gunicorn.conf.py usa un solo worker; con varios se
+    puede cambiar por otro bus con set_event_bus o EVENT_BUS. Un bus debe tener
+    publish(event) y subscribe(matches, last_event_id) que devuelva una
+    suscripción como Subscription (overflowed, get(timeout) y uso con with).
+    """
+
+    def __init__(self, history_size=EVENT_HISTORY_SIZE):
+        # Los ids de otra instancia (otro proceso o antes de un reinicio) no se confunden con los propios
+        self.instance = uuid.uuid4().hex[:8]
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self._last_seq = 0
+        self._lock = threading.Lock()
+
+    def publish(self, event):
+        with self._lock:
+            self._last_seq += 1
+            event = {**event, 'id': f'{self.instance}-{self._last_seq}'}
+            self._history.append((self._last_seq, event))
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.offer(event)
+        return event
+
+    def _sequence(self, event_id):
+        """Número de un id de esta instancia, o None si es de otra o no es válido"""
+        instance, _, seq = str(event_id).rpartition('-')
+        if instance != self.instance or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def subscribe(self, matches=None, last_event_id=None):
+        """Nueva suscripción; con last_event_id se reencolan los eventos posteriores.
+
+        Si el historial ya no alcanza hasta last_event_id (o el id es de otro
+        proceso o de antes de un reinicio) la suscripción queda marcada como
+        desbordada para que el cliente recargue.
+        """
+        subscription = Subscription(self, matches)
+        with self._lock:
+            if last_event_id:
+                last_seq = self._sequence(last_event_id)
+                oldest = self._history[0][0] if self._history else self._last_seq + 1
+                if last_seq is None or last_seq > self._last_seq or oldest > last_seq + 1:
+                    subscription.overflowed = True
+                if last_seq is not None:
+                    for seq, event in self._history:
+                        if seq > last_seq:
+                            subscription.offer(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+_event_bus = None
+_event_bus_lock = threading.Lock()
+
+def _load_event_bus(path):
+    """Bus indicado como 'modulo:fabrica' (la fábrica se llama sin argumentos)"""
+    module_name, _, factory = path.partition(':')
+    return getattr(importlib.import_module(module_name), factory)()
+
+def get_event_bus():
+    """Bus de eventos de la aplicación (EVENT_BUS o, si no se indica, EventBus en proceso)"""
+    global _event_bus
+    if _event_bus is None:
+        with _event_bus_lock:
+            if _event_bus is None:
+                path = os.getenv('EVENT_BUS')
+                _event_bus = _load_event_bus(path) if path else EventBus()
+    return _event_bus
+
+def set_event_bus(bus):
+    """Reemplazar el bus (por ejemplo uno respaldado por Redis o LISTEN/NOTIFY)"""
+    global _event_bus
+    with _event_bus_lock:
+        _event_bus = bus
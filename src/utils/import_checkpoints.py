@@ -0,0 +1,74 @@
+from datetime import datetime
+from itertools import islice
+
+class ImportCheckpoint:
+    """Progreso guardado de una importación, identificada por el hash del archivo y el tipo.
+
+    Permite que un archivo reenviado continúe desde el último bloque confirmado
+    o devuelva el resultado anterior si ya se importó completo. Un archivo que
+    terminó con filas con error queda como 'completado_con_errores' y al
+    reenviarlo se procesa de nuevo desde el principio.
+    """
+
+    def __init__(self, supabase, file_hash, kind, chunk_size, user_id=None):
+        self.supabase = supabase
+        self.file_hash = file_hash
+        self.kind = kind
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.chunks_committed = 0
+        self.status = None
+        self.result = None
+
+        existing = supabase.table('import_checkpoints').select('*').eq(
+            'file_hash', file_hash
+        ).eq('import_type', kind).execute()
+        if existing.data:
+            checkpoint = existing.data[0]
+            # Los límites de bloque deben coincidir para poder continuar
+            self.chunk_size = checkpoint['chunk_size']
+            self.chunks_committed = checkpoint['chunks_committed']
+            self.status = checkpoint['status']
+            self.result = checkpoint['result']
+
+    @property
+    def completed(self):
+        return self.status == 'completado'
+
+    def restart(self, chunk_size):
+        """Volver a procesar el archivo desde el primer bloque"""
+        self.chunk_size = chunk_size
+        self.chunks_committed = 0
+        self.status = None
+        self.result = None
+
+    @property
+    def resumed(self):
+        return self.chunks_committed > 0
+
+    def pending(self, chunks):
+        """Omitir los bloques ya confirmados sin tocar la base de datos"""
+        return islice(chunks, self.chunks_committed, None)
+
+    def _save(self, status, result):
+        self.supabase.table('import_checkpoints').upsert({
+            'file_hash': self.file_hash,
+            'import_type': self.kind,
+            'chunk_size': self.chunk_size,
+            'chunks_committed': self.chunks_committed,
+            'status': status,
+            'result': result,
+            'created_by': self.user_id,
+            'updated_at': datetime.now().isoformat()
+        }, on_conflict='file_hash,import_type').execute()
+        self.status = status
+        self.result = result
+
+    def commit(self, result):
+        """Registrar un bloque escrito por completo"""
+        self.chunks_committed += 1
+        self._save('en_proceso', result)
+
+    def finish(self, result, retryable=False):
+        """Marcar el archivo como importado; con errores y retryable se puede reintentar"""
+        self._save('completado_con_errores' if retryable and result['errors'] else 'completado', result)
@@ -0,0 +1,119 @@
+import os
+
+# Tamaño de bloque para escrituras masivas (una llamada a Supabase por bloque)
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 500))
+# Máximo que puede pedir el cliente: más grande deja de acotar la memoria por bloque
+MAX_IMPORT_CHUNK_SIZE = 1000
+# Valores por consulta in_() para no exceder el largo de URL de PostgREST
+LOOKUP_BATCH_SIZE = int(os.getenv('IMPORT_LOOKUP_BATCH_SIZE', 100))
+
+def chunked(items, size):
+    """Dividir una lista en bloques de tamaño fijo"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def fetch_ids_by_value(supabase, table, column, values, batch_size=LOOKUP_BATCH_SIZE):
+    """Obtener {valor: id} para los valores existentes usando consultas in_() por lotes"""
+    ids = {}
+    distinct = list(dict.fromkeys(v for v in values if v is not None))
+    for batch in chunked(distinct, batch_size):
+        result = supabase.table(table).select(f'id, {column}').in_(column, batch).execute()
+        for record in result.data:
+            # Conservar el primer registro, igual que data[0] en la búsqueda por fila
+            ids.setdefault(record[column], record['id'])
+    return ids
+
+def _group_by_columns(records):
+    """Agrupar registros por conjunto de columnas (PostgREST exige columnas uniformes por lote)"""
+    groups = {}
+    for record in records:
+        groups.setdefault(tuple(sorted(record['data'])), []).append(record)
+    return groups.values()
+
+def write_in_chunks(supabase, table, records, mode='insert', chunk_size=None, on_conflict='id',
+                    ignore_duplicates=False):
+    """Escribir registros en bloques con una sola llamada por bloque.
+
+    Cada registro es {'rows': [números de fila], 'data': {...}}. Si un bloque falla
+    se reintenta fila por fila para conservar los errores por fila. Con
+    ignore_duplicates, las filas que ya existen (según on_conflict) se omiten y
+    no cuentan como escritas.
+    Devuelve (filas escritas, datos devueltos, errores por fila, errores por bloque).
+    """
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    written = 0
+    returned = []
+    errors = []
+    chunk_errors = []
+
+    def execute(payload):
+        query = supabase.table(table)
+        if mode == 'upsert':
+            return query.upsert(payload, on_conflict=on_conflict, ignore_duplicates=ignore_duplicates).execute()
+        return query.insert(payload).execute()
+
+    def rows_written(chunk, data):
+        # Con ignore_duplicates la base solo devuelve las filas que insertó
+        if not ignore_duplicates:
+            return sum(len(record['rows']) for record in chunk)
+        keys = on_conflict.split(',')
+        inserted = {tuple(str(row.get(key)) for key in keys) for row in data}
+        return sum(
+            len(record['rows']) for record in chunk
+            if tuple(str(record['data'].get(key)) for key in keys) in inserted
+        )
+
+    for group in _group_by_columns(records):
+        for chunk in chunked(group, chunk_size):
+            try:
+                result = execute([record['data'] for record in chunk])
+                returned.extend(result.data or [])
+                written += rows_written(chunk, result.data or [])
+            except Exception as e:
+                chunk_errors.append({
+                    'rows': [n for record in chunk for n in record['rows']],
+                    'error': str(e)
+                })
+                # Reintentar individualmente para identificar las filas con error
+                for record in chunk:
+                    try:
+                        result = execute([record['data']])
+                        returned.extend(result.data or [])
+                        written += rows_written([record], result.data or [])
+                    except Exception as row_error:
+                        for n in record['rows']:
+                            errors.append(f"Fila {n}: {str(row_error)}")
+
+    return written, returned, errors, chunk_errors
+
+class NameLookup:
+    """Índice en memoria valor → id para resolver filas sin consultas por fila"""
+
+    def __init__(self, supabase, table, column):
+        self.supabase = supabase
+        self.table = table
+        self.column = column
+        self.ids = {}
+        self._loaded = set()
+
+    def load(self, values):
+        """Consultar por lotes solo los valores que aún no se han buscado"""
+        pending = [v for v in dict.fromkeys(values) if v is not None and v not in self._loaded]
+        if pending:
+            self.ids.update(fetch_ids_by_value(self.supabase, self.table, self.column, pending))
+            self._loaded.update(pending)
+        return self
+
+    def get(self, value):
+        return self.ids.get(value)
+
+    def add(self, value, record_id):
+        """Registrar un valor creado durante la importación"""
+        self.ids.setdefault(value, record_id)
+        self._loaded.add(value)
+
+def distinct_names(df, column):
+    """Nombres distintos (sin espacios extremos) de una columna del archivo"""
+    if column not in df.columns:
+        return []
+    return df[column].dropna().astype(str).str.strip().unique().tolist()
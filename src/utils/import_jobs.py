@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Importaciones simultáneas por proceso y trabajos en espera permitidos
+IMPORT_MAX_WORKERS = int(os.getenv('IMPORT_MAX_WORKERS', 2))
+IMPORT_MAX_PENDING = int(os.getenv('IMPORT_MAX_PENDING', 10))
+# Tiempo que se conservan en memoria los trabajos terminados (en import_jobs quedan siempre)
+IMPORT_JOB_TTL = int(os.getenv('IMPORT_JOB_TTL', 3600))
+# Cada cuánto se guarda el progreso en import_jobs y se revisa si otro worker pidió cancelar
+JOB_SYNC_SECONDS = 1
+
+_executor = ThreadPoolExecutor(max_workers=IMPORT_MAX_WORKERS, thread_name_prefix='import')
+# Trabajos que corren en este proceso; su estado se copia a la tabla import_jobs
+# (migración 012) para consultarlos o cancelarlos desde cualquier worker
+_jobs = {}
+_lock = threading.Lock()
+
+class _JobView:
+    def visible_to(self, user_id, role):
+        """Solo quien lo envió o un administrador puede ver o cancelar el trabajo"""
+        return role == 'administrador' or (user_id is not None and user_id == self.user_id)
+
+class ImportJob(_JobView):
+    """Estado y progreso de una importación en segundo plano"""
+
+    def __init__(self, kind, filename, user_id, supabase=None):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.filename = filename
+        self.user_id = user_id
+        self.status = 'pendiente'
+        self.error = None
+        self.result = {'imported_count': 0, 'total_rows': 0, 'errors': [], 'chunk_errors': []}
+        self.created_at = datetime.now()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._supabase = supabase
+        self._saved_at = None
+        self._cancel_checked_at = time.monotonic()
+
+    @property
+    def cancelled(self):
+        if not self._cancel.is_set() and self._supabase and time.monotonic() - self._cancel_checked_at >= JOB_SYNC_SECONDS:
+            self._cancel_checked_at = time.monotonic()
+            try:
+                row = self._supabase.table('import_jobs').select('cancel_requested').eq('id', self.id).execute()
+                if row.data and row.data[0]['cancel_requested']:
+                    self._cancel.set()
+            except Exception as e:
+                print(f"Warning: no se revisó la cancelación del trabajo {self.id}: {e}")
+        return self._cancel.is_set()
+
+    @property
+    def is_active(self):
+        return self.status in ('pendiente', 'en_proceso')
+
+    def cancel(self):
+        self._cancel.set()
+        if self._supabase:
+            _request_cancel(self._supabase, self.id)
+
+    def save(self, force=False):
+        """Copiar el estado a import_jobs (como mucho cada JOB_SYNC_SECONDS salvo force)"""
+        if not self._supabase:
+            return
+        now = time.monotonic()
+        if not force and self._saved_at is not None and now - self._saved_at < JOB_SYNC_SECONDS:
+            return
+        self._saved_at = now
+        try:
+            self._supabase.table('import_jobs').upsert({
+                'id': self.id,
+                'import_type': self.kind,
+                'user_id': self.user_id,
+                'status': self.status,
+                'state': self.to_dict(),
+                'updated_at': datetime.now().isoformat()
+            }).execute()
+        except Exception as e:
+            print(f"Warning: no se guardó el estado del trabajo {self.id}: {e}")
+
+    def track(self, chunks):
+        """Entregar bloques hasta que se cancele el trabajo (se detiene entre bloques)"""
+        for chunk in chunks:
+            if self.cancelled:
+                break
+            yield chunk
+
+    def progress(self, result):
+        """Actualizar el progreso después de cada bloque"""
+        self.result = result
+        self.save()
+
+    def to_dict(self):
+        end = self.finished or time.monotonic()
+        elapsed = end - self.started if self.started else 0
+        rows_processed = self.result['total_rows']
+        return {
+            'id': self.id,
+            'type': self.kind,
+            'filename': self.filename,
+            'status': self.status,
+            'error': self.error,
+            'rows_processed': rows_processed,
+            'imported_count': self.result['imported_count'],
+            'errors_count': len(self.result['errors']),
+            'errors': list(self.result['errors']),
+            'chunk_errors': list(self.result['chunk_errors']),
+            'elapsed_seconds': round(elapsed, 2),
+            'rows_per_second': round(rows_processed / elapsed, 1) if elapsed else 0,
+            'created_at': self.created_at.isoformat()
+        }
+
+class StoredJob(_JobView):
+    """Trabajo que corre en otro worker, leído de import_jobs"""
+
+    def __init__(self, row, supabase):
+        self.id = row['id']
+        self.user_id = row['user_id']
+        self.status = row['status']
+        self._state = row['state']
+        self._supabase = supabase
+
+    def cancel(self):
+        # El worker que lo ejecuta lo ve al terminar el bloque en curso
+        _request_cancel(self._supabase, self.id)
+
+    def to_dict(self):
+        return {**self._state, 'status': self.status}
+
+def _request_cancel(supabase, job_id):
+    supabase.table('import_jobs').update({'cancel_requested': True}).eq('id', job_id).execute()
+
+def _prune():
+    now = time.monotonic()
+    for job_id, job in list(_jobs.items()):
+        if job.finished and now - job.finished > IMPORT_JOB_TTL:
+            del _jobs[job_id]
+
+def _run(job, func):
+    if job.cancelled:
+        job.status = 'cancelado'
+        job.finished = time.monotonic()
+        job.save(force=True)
+        return
+    job.status = 'en_proceso'
+    job.started = time.monotonic()
+    job.save(force=True)
+    try:
+        func(job)
+        job.status = 'cancelado' if job.cancelled else 'completado'
+    except Exception as e:
+        job.status = 'error'
+        job.error = str(e)
+    finally:
+        job.finished = time.monotonic()
+        job.save(force=True)
+
+def submit_job(kind, filename, user_id, func, supabase=None):
+    """Encolar func(job) en el pool de importación; None si la cola está llena"""
+    with _lock:
+        _prune()
+        if sum(1 for job in _jobs.values() if job.is_active) >= IMPORT_MAX_PENDING:
+            return None
+        job = ImportJob(kind, filename, user_id, supabase)
+        _jobs[job.id] = job
+    job.save(force=True)
+    _executor.submit(_run, job, func)
+    return job
+
+def get_job(job_id, supabase=None):
+    """Trabajo de este proceso o, si lo recibió otro worker, su último estado guardado"""
+    with _lock:
+        job = _jobs.get(job_id)
+    if job or not supabase:
+        return job
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return None
+    row = supabase.table('import_jobs').select('id, user_id, status, state').eq('id', job_id).execute()
+    return StoredJob(row.data[0], supabase) if row.data else None
@@ -0,0 +1,181 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Mismos formatos y en el mismo orden que parse_date
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y']
+
+# Campos requeridos por cada importador
+PATIENT_REQUIRED = ['nombre_completo']
+PAYMENT_REQUIRED = ['paciente', 'monto']
+APPOINTMENT_REQUIRED = ['paciente', 'fecha']
+
+def _empty(index):
+    return pd.Series([None] * len(index), index=index, dtype=object)
+
+def _column(df, column):
+    return df[column] if column in df.columns else _empty(df.index)
+
+def _to_object(series, keep=None):
+    # Los valores nulos se devuelven como None, igual que los helpers por fila
+    keep = series.notna() if keep is None else keep
+    return series.astype(object).where(keep, None)
+
+def _fill(index, present, values):
+    # Asignación posicional con numpy: pandas puede convertir None en NaN al alinear
+    result = np.full(len(index), None, dtype=object)
+    result[np.asarray(present, dtype=bool)] = values.to_numpy(dtype=object)
+    return pd.Series(result, index=index, dtype=object)
+
+def normalize_text(series):
+    """Versión vectorizada de str(valor).strip() con nulos como None"""
+    present = series.notna()
+    return _fill(series.index, present, series[present].astype(str).str.strip())
+
+def normalize_phones(series):
+    """Versión vectorizada de clean_phone_number"""
+    present = series.notna()
+    digits = series[present].astype(str).str.replace(r'[^\d+]', '', regex=True)
+    return _fill(series.index, present, _to_object(digits, digits != ''))
+
+def _iso_dates(parsed):
+    """Fechas como date.isoformat(): strftime no rellena los años de menos de 4 dígitos"""
+    return (
+        parsed.dt.year.astype(str).str.zfill(4) + '-'
+        + parsed.dt.month.astype(str).str.zfill(2) + '-'
+        + parsed.dt.day.astype(str).str.zfill(2)
+    )
+
+def _parse_date_strings(values):
+    """Fechas ISO para un arreglo de textos probando cada formato en orden"""
+    result = np.full(len(values), None, dtype=object)
+    # Probar cada formato solo sobre los textos que aún no se han reconocido
+    positions = np.arange(len(values))
+    for fmt in DATE_FORMATS:
+        if not len(positions):
+            break
+        parsed = pd.to_datetime(pd.Series(values[positions], dtype=object), format=fmt, errors='coerce')
+        matched = parsed.notna().to_numpy()
+        result[positions[matched]] = _iso_dates(parsed[matched]).to_numpy(dtype=object)
+        positions = positions[~matched]
+    return result
+
+def normalize_dates(series):
+    """Versión vectorizada de parse_date (fecha ISO o None)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        present = series.notna()
+        return _fill(series.index, present, _iso_dates(series[present]))
+
+    result = np.full(len(series), None, dtype=object)
+    present = series.notna().to_numpy()
+    is_text = present & series.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+    is_datetime = present & series.map(lambda value: isinstance(value, datetime)).to_numpy(dtype=bool)
+
+    if is_text.any():
+        # Las fechas se repiten mucho: se interpreta cada texto distinto una sola vez
+        codes, uniques = pd.factorize(series[is_text])
+        result[is_text] = _parse_date_strings(np.asarray(uniques, dtype=object))[codes]
+
+    if is_datetime.any():
+        parsed = pd.to_datetime(series[is_datetime])
+        result[is_datetime] = _iso_dates(parsed).to_numpy(dtype=object)
+    return pd.Series(result, index=series.index, dtype=object)
+
+def normalize_zonas(series):
+    """Separar zonas por coma; None cuando la celda está vacía"""
+    present = series.notna()
+    codes, uniques = pd.factorize(series[present].astype(str))
+    # Cada texto distinto se separa una sola vez
+    zonas = np.empty(len(uniques), dtype=object)
+    for position, value in enumerate(uniques):
+        zonas[position] = [zona.strip() for zona in value.split(',')]
+    return _fill(series.index, present, pd.Series(zonas[codes], dtype=object))
+
+def infer_column_type(series):
+    """Tipo de una columna de muestra; los textos (p. ej. CSV) se revisan como número o fecha"""
+    kind = pd.api.types.infer_dtype(series, skipna=True)
+    if kind != 'string':
+        return kind
+    values = series.dropna()
+    if pd.to_numeric(values, errors='coerce').notna().all():
+        return 'integer' if values.str.fullmatch(r'[+-]?\d+').all() else 'floating'
+    if normalize_dates(values).notna().all():
+        return 'date'
+    return kind
+
+def missing_mask(df, columns):
+    """Filas a las que les falta alguno de los campos requeridos"""
+    mask = pd.Series(False, index=df.index)
+    for column in columns:
+        mask |= _column(df, column).isna()
+    return mask
+
+def invalid_values(raw, parsed):
+    """Valor original de las celdas que no se pudieron interpretar (None en las demás)"""
+    return _to_object(raw, raw.notna() & parsed.isna())
+
+def normalize_patients(df):
+    """Limpiar todas las columnas de pacientes en una sola pasada"""
+    fecha_nacimiento = normalize_dates(_column(df, 'fecha_nacimiento'))
+    return pd.DataFrame({
+        'missing': missing_mask(df, PATIENT_REQUIRED),
+        'invalid_date': invalid_values(_column(df, 'fecha_nacimiento'), fecha_nacimiento),
+        'nombre_completo': normalize_text(_column(df, 'nombre_completo')),
+        'telefono': normalize_phones(_column(df, 'telefono')),
+        'localidad': normalize_text(_column(df, 'localidad')),
+        'fecha_nacimiento': fecha_nacimiento,
+        'observaciones': normalize_text(_column(df, 'observaciones')),
+        'zonas_tratamiento': normalize_zonas(_column(df, 'zonas_tratamiento'))
+    }, index=df.index)
+
+def _lowercase(df, column, default):
+    # str(row.get(columna, default)).lower(): el valor por defecto solo aplica si falta la columna
+    if column not in df.columns:
+        return pd.Series(default, index=df.index, dtype=object)
+    return df[column].map(str).str.lower().astype(object)
+
+def normalize_payments(df):
+    """Limpiar todas las columnas de pagos en una sola pasada"""
+    fecha = normalize_dates(_column(df, 'fecha'))
+    return pd.DataFrame({
+        'missing': missing_mask(df, PAYMENT_REQUIRED),
+        'invalid_date': invalid_values(_column(df, 'fecha'), fecha),
+        'paciente': normalize_text(_column(df, 'paciente')),
+        'monto': _column(df, 'monto').astype(object),
+        'metodo_pago': _lowercase(df, 'metodo_pago', 'efectivo'),
+        'fecha': fecha,
+        'observaciones': normalize_text(_column(df, 'observaciones'))
+    }, index=df.index)
+
+def normalize_appointments(df):
+    """Limpiar todas las columnas de citas en una sola pasada"""
+    hora = df['hora'].map(str).str.strip().astype(object) if 'hora' in df.columns else '10:00'
+    fecha = normalize_dates(_column(df, 'fecha'))
+    return pd.DataFrame({
+        'missing': missing_mask(df, APPOINTMENT_REQUIRED),
+        'invalid_date': invalid_values(_column(df, 'fecha'), fecha),
+        'paciente': normalize_text(_column(df, 'paciente')),
+        'servicio': normalize_text(_column(df, 'servicio')),
+        'fecha': fecha,
+        'hora': hora,
+        'numero_sesion': df['numero_sesion'].astype(object) if 'numero_sesion' in df.columns else 1,
+        'precio_sesion': _to_object(_column(df, 'precio_sesion')),
+        'status': _lowercase(df, 'status', 'agendada')
+    }, index=df.index)
+
+NORMALIZERS = {
+    'patients': normalize_patients,
+    'payments': normalize_payments,
+    'appointments': normalize_appointments
+}
+
+def normalize_chunk(kind, df, mapping):
+    """Renombrar columnas según el column_mapping y normalizar el bloque"""
+    return NORMALIZERS[kind](df.rename(columns=mapping))
+
+def iter_records(df):
+    """Recorrer (índice, fila como dict) más rápido que iterrows/to_dict"""
+    columns = list(df.columns)
+    values = [df[column].tolist() for column in columns]
+    for index, row in zip(df.index, zip(*values)):
+        yield index, dict(zip(columns, row))
@@ -0,0 +1,193 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from .import_normalize import normalize_chunk
+from .import_reader import COPY_BUFFER_SIZE, file_extension, iter_row_chunks
+
+# Procesos para leer y normalizar hojas/archivos en paralelo
+IMPORT_PROCESSES = int(os.getenv('IMPORT_PROCESSES', os.cpu_count() or 1))
+SPREADSHEET_EXTENSIONS = {'xlsx', 'xls', 'csv'}
+# Tamaño máximo del contenido de un zip una vez descomprimido
+IMPORT_MAX_UNZIPPED_BYTES = int(os.getenv('IMPORT_MAX_UNZIPPED_MB', 500)) * 1024 * 1024
+# Espera entre revisiones de los bloques que van dejando los procesos
+CHUNK_POLL_SECONDS = 0.05
+
+_pool = None
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn: el servidor tiene hilos activos y fork podría heredar bloqueos
+        _pool = ProcessPoolExecutor(
+            max_workers=IMPORT_PROCESSES, mp_context=multiprocessing.get_context('spawn')
+        )
+    return _pool
+
+def _discard_pool(pool):
+    """Descartar un pool roto (p. ej. un proceso murió por memoria) para que la siguiente importación cree otro"""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def sheet_names(source, filename):
+    """Hojas de un libro de Excel (un CSV tiene una sola parte sin nombre)"""
+    extension = file_extension(filename)
+    source.seek(0)
+    if extension == 'xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(source, read_only=True)
+        try:
+            return workbook.sheetnames
+        finally:
+            workbook.close()
+    if extension == 'xls':
+        import pandas as pd
+
+        return pd.ExcelFile(source).sheet_names
+    return [None]
+
+def _is_multipart(source, filename):
+    extension = file_extension(filename)
+    if extension == 'zip':
+        return True
+    return extension in ('xlsx', 'xls') and len(sheet_names(source, filename)) > 1
+
+def _materialize(source, filename, directory):
+    """Copiar el archivo (o los archivos del zip) al directorio temporal para los procesos"""
+    source.seek(0)
+    if file_extension(filename) != 'zip':
+        path = os.path.join(directory, f'upload.{file_extension(filename)}')
+        with open(path, 'wb') as target:
+            shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+        return [(path, filename, os.path.basename(filename))]
+
+    files = []
+    with zipfile.ZipFile(source) as archive:
+        members = sorted(
+            (info for info in archive.infolist()
+             if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+             and file_extension(info.filename) in SPREADSHEET_EXTENSIONS),
+            key=lambda info: info.filename
+        )
+        if sum(info.file_size for info in members) > IMPORT_MAX_UNZIPPED_BYTES:
+            raise ValueError(_zip_too_large())
+        remaining = IMPORT_MAX_UNZIPPED_BYTES
+        for position, info in enumerate(members):
+            # Nombre propio en disco: los miembros pueden repetir nombre en carpetas distintas
+            path = os.path.join(directory, f'{position}.{file_extension(info.filename)}')
+            with archive.open(info) as member, open(path, 'wb') as target:
+                remaining = _copy_limited(member, target, remaining)
+            files.append((path, info.filename, info.filename))
+    return files
+
+def _zip_too_large():
+    return f'El contenido del zip supera {IMPORT_MAX_UNZIPPED_BYTES // (1024 * 1024)} MB'
+
+def _copy_limited(source, target, remaining):
+    # El tamaño declarado en el zip puede ser falso: se cuenta lo que realmente se descomprime
+    while True:
+        block = source.read(COPY_BUFFER_SIZE)
+        if not block:
+            return remaining
+        remaining -= len(block)
+        if remaining < 0:
+            raise ValueError(_zip_too_large())
+        target.write(block)
+
+def _chunk_path(output, number):
+    return f'{output}-{number}.pkl'
+
+def _normalize_part(path, filename, sheet, kind, mapping, chunk_size, output):
+    """Leer y normalizar una hoja o archivo (se ejecuta en otro proceso).
+
+    Cada bloque se deja en disco en cuanto está listo, así el proceso solo
+    tiene un bloque en memoria. Devuelve cuántos bloques escribió.
+    """
+    count = 0
+    with open(path, 'rb') as source:
+        for df in iter_row_chunks(source, filename, chunk_size, sheet):
+            target = _chunk_path(output, count)
+            normalize_chunk(kind, df, mapping).to_pickle(f'{target}.tmp')
+            # Renombrar al final: el lector nunca ve un bloque a medio escribir
+            os.replace(f'{target}.tmp', target)
+            count += 1
+    return count
+
+def _part_chunks(future, output):
+    """Bloques de una parte en orden, a medida que el proceso los escribe"""
+    number = 0
+    while True:
+        path = _chunk_path(output, number)
+        if os.path.exists(path):
+            normalized = pd.read_pickle(path)
+            os.remove(path)
+            number += 1
+            yield normalized
+        elif future.done():
+            # result() propaga el error del proceso, si lo hubo
+            if number >= future.result():
+                return
+        else:
+            time.sleep(CHUNK_POLL_SECONDS)
+
+def _iter_parallel_chunks(source, filename, kind, mapping, chunk_size):
+    with tempfile.TemporaryDirectory(prefix='import-') as directory:
+        parts = []
+        for path, member_name, label in _materialize(source, filename, directory):
+            with open(path, 'rb') as member:
+                sheets = sheet_names(member, member_name)
+            for sheet in sheets:
+                parts.append((path, member_name, sheet, label if sheet is None else f'{label}: {sheet}'))
+
+        pool = _get_pool()
+        pending = deque()
+        next_part = 0
+        try:
+            while next_part < len(parts) or pending:
+                # Una parte en vuelo por proceso; cada una guarda sus bloques en disco
+                while next_part < len(parts) and len(pending) < IMPORT_PROCESSES:
+                    path, member_name, sheet, label = parts[next_part]
+                    output = os.path.join(directory, f'part-{next_part}')
+                    future = pool.submit(
+                        _normalize_part, path, member_name, sheet, kind, mapping, chunk_size, output
+                    )
+                    pending.append((next_part, label, future, output))
+                    next_part += 1
+
+                # Entregar en orden para que los puntos de control sean deterministas
+                position, label, future, output = pending.popleft()
+                for normalized in _part_chunks(future, output):
+                    normalized.attrs['part'] = position
+                    normalized.attrs['source'] = label
+                    yield normalized
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+        finally:
+            for _, _, future, _ in pending:
+                future.cancel()
+
+def iter_normalized_chunks(source, filename, kind, mapping, chunk_size):
+    """Bloques normalizados del archivo.
+
+    Un CSV o un libro de una hoja se lee en flujo en este proceso. Los libros con
+    varias hojas y los zip se reparten entre procesos (una parte por hoja/archivo)
+    que dejan sus bloques en disco; se entregan en orden a la etapa de escritura
+    y en memoria solo hay un bloque por proceso.
+    """
+    if _is_multipart(source, filename):
+        yield from _iter_parallel_chunks(source, filename, kind, mapping, chunk_size)
+        return
+    for df in iter_row_chunks(source, filename, chunk_size):
+        yield normalize_chunk(kind, df, mapping)
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import tempfile
+import pandas as pd
+
+# Los archivos más grandes que esto se pasan a disco (archivo anónimo, sin ruta fija)
+SPOOL_MAX_SIZE = int(os.getenv('IMPORT_SPOOL_MAX_SIZE', 8 * 1024 * 1024))
+COPY_BUFFER_SIZE = 1024 * 1024
+COUNT_CHUNK_SIZE = 5000
+
+def file_extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+def spool_upload(file):
+    """Copiar el archivo subido a un temporal anónimo sin cargarlo completo en memoria.
+
+    Devuelve el temporal y el hash SHA-256 del contenido.
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    digest = hashlib.sha256()
+    while True:
+        block = file.stream.read(COPY_BUFFER_SIZE)
+        if not block:
+            break
+        digest.update(block)
+        spooled.write(block)
+    spooled.seek(0)
+    return spooled, digest.hexdigest()
+
+def _header_names(header):
+    """Nombres de columna como los genera pandas.read_excel"""
+    names = []
+    unnamed = []
+    for position, name in enumerate(header):
+        if name is None or (isinstance(name, str) and not name.strip()):
+            names.append(f'Unnamed: {position}')
+            unnamed.append(position)
+        else:
+            names.append(name)
+    # Encabezados repetidos: OBSERVACIONES, OBSERVACIONES.1, ... con el mismo
+    # algoritmo del lector de pandas (primero las columnas con nombre)
+    counts = {}
+    order = [position for position in range(len(names)) if position not in unnamed] + unnamed
+    for position in order:
+        base = name = names[position]
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[base] = count + 1
+            name = f'{base}.{count}'
+            count = count + 1 if name in names else counts.get(name, 0)
+        names[position] = name
+        counts[name] = count + 1
+    return names
+
+def _frame(rows, columns, start):
+    # Índice global para que los mensajes 'Fila N' sigan siendo correctos entre bloques
+    return pd.DataFrame(rows, columns=columns, index=pd.RangeIndex(start, start + len(rows)))
+
+def _iter_xlsx_chunks(source, chunk_size, sheet=None):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet is not None else workbook.active
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _header_names(header)
+        width = len(columns)
+        start = 0
+        buffer = []
+        blank_rows = 0
+        for values in rows:
+            # Las filas vacías solo cuentan si hay datos después, igual que pandas
+            if all(value is None for value in values):
+                blank_rows += 1
+                continue
+            buffer.extend([(None,) * width] * blank_rows)
+            blank_rows = 0
+            buffer.append(tuple(values[:width]) + (None,) * (width - len(values)))
+            while len(buffer) >= chunk_size:
+                yield _frame(buffer[:chunk_size], columns, start)
+                start += chunk_size
+                buffer = buffer[chunk_size:]
+        if buffer:
+            yield _frame(buffer, columns, start)
+    finally:
+        workbook.close()
+
+def iter_row_chunks(source, filename, chunk_size, sheet=None):
+    """Leer filas del archivo (o de una hoja) en DataFrames de tamaño fijo con memoria constante"""
+    if chunk_size < 1:
+        raise ValueError('El tamaño de bloque debe ser al menos 1')
+    extension = file_extension(filename)
+    source.seek(0)
+    if extension == 'csv':
+        # Leer como texto para que el tipo no dependa de cada bloque
+        yield from pd.read_csv(source, chunksize=chunk_size, dtype=str)
+    elif extension == 'xlsx':
+        yield from _iter_xlsx_chunks(source, chunk_size, sheet)
+    else:
+        # El formato .xls antiguo no permite lectura por filas; se lee completo
+        df = pd.read_excel(source, sheet_name=sheet if sheet is not None else 0)
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+
+def _xlsx_row_count(source):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True)
+    try:
+        # max_row viene de la dimensión guardada en el libro, sin leer las celdas
+        return workbook.active.max_row
+    finally:
+        workbook.close()
+
+def _csv_line_count(source):
+    lines = 0
+    last = b'\n'
+    while True:
+        block = source.read(COPY_BUFFER_SIZE)
+        if not block:
+            break
+        lines += block.count(b'\n')
+        last = block[-1:]
+    # Última línea sin salto final
+    if last != b'\n':
+        lines += 1
+    return lines
+
+def count_rows(source, filename):
+    """Total de filas de datos sin interpretar el archivo completo"""
+    extension = file_extension(filename)
+    source.seek(0)
+    if extension == 'csv':
+        total = _csv_line_count(source)
+    elif extension == 'xlsx':
+        total = _xlsx_row_count(source)
+    else:
+        total = None
+
+    if total is None:
+        # Sin metadatos de dimensión: contar por bloques
+        return sum(len(chunk) for chunk in iter_row_chunks(source, filename, COUNT_CHUNK_SIZE))
+    # Descontar la fila de encabezados
+    return max(total - 1, 0)
+
+def read_sample(source, filename, rows):
+    """Primeras filas del archivo sin leer el resto"""
+    chunks = iter_row_chunks(source, filename, rows)
+    try:
+        return next(chunks, pd.DataFrame())
+    finally:
+        chunks.close()
@@ -0,0 +1,108 @@
+import base64
+import json
+import os
+import threading
+import time
+
+# Tamaño de página por defecto y máximo permitido por petición
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+COUNT_METHODS = {'exact', 'estimated'}
+# Supabase devuelve como mucho max-rows filas por consulta (1000 por defecto).
+# keyset_page pide limit + 1 filas, así que las páginas deben quedar por debajo:
+# si no, la fila extra nunca llega y la lectura se corta sin cursor
+SUPABASE_MAX_ROWS = int(os.getenv('SUPABASE_MAX_ROWS', 1000))
+# Páginas de las cargas internas (índices y rangos del calendario)
+LOAD_PAGE_SIZE = 500
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Tamaño de página del query string, acotado a [1, maximum]"""
+    limit = int(value) if value else default
+    return max(1, min(limit, maximum))
+
+def parse_count(value):
+    """Método de conteo pedido ('exact' o 'estimated'); None si no se pidió total"""
+    if not value:
+        return None
+    if value not in COUNT_METHODS:
+        raise ValueError("count debe ser 'exact' o 'estimated'")
+    return value
+
+def encode_cursor(row, columns):
+    """Cursor opaco con los valores de las columnas de orden de la última fila"""
+    payload = json.dumps([row[column] for column in columns], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, columns):
+    """Valores del cursor en el orden de columns; ValueError si no es válido"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Cursor inválido')
+    if not isinstance(values, list) or len(values) != len(columns) or None in values:
+        raise ValueError('Cursor inválido')
+    return values
+
+def _quote(value):
+    # Comillas dobles para que ':' '+' ',' o '()' no rompan la sintaxis de PostgREST
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{text}"'
+
+def keyset_filter(columns, values, descending=True):
+    """Filtro or() de PostgREST para las filas posteriores al cursor.
+
+    (a, b) < (x, y) se expande como a < x OR (a = x AND b < y).
+    """
+    operator = 'lt' if descending else 'gt'
+    conditions = []
+    for position, column in enumerate(columns):
+        equal = [f'{previous}.eq.{_quote(value)}' for previous, value in zip(columns[:position], values)]
+        strict = f'{column}.{operator}.{_quote(values[position])}'
+        conditions.append(f"and({','.join(equal + [strict])})" if equal else strict)
+    return ','.join(conditions)
+
+def keyset_page(query, columns, cursor, limit, descending=True):
+    """Aplicar cursor, orden estable y límite (una fila extra para saber si hay más)"""
+    if limit >= SUPABASE_MAX_ROWS:
+        raise ValueError(f'El tamaño de página debe ser menor que {SUPABASE_MAX_ROWS}')
+    if cursor:
+        query = query.or_(keyset_filter(columns, decode_cursor(cursor, columns), descending))
+    for column in columns:
+        query = query.order(column, desc=descending)
+    return query.limit(limit + 1)
+
+def split_page(rows, columns, limit):
+    """Separar la página de la fila extra y calcular el siguiente cursor"""
+    page = rows[:limit]
+    has_more = len(rows) > limit
+    next_cursor = encode_cursor(page[-1], columns) if has_more and page else None
+    return page, next_cursor
+
+class CountCache:
+    """Totales de listados guardados unos segundos para no contarlos en cada página.
+
+    La clave identifica el listado (filtros y método de conteo); invalidate()
+    los descarta cuando este proceso agrega o quita filas.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._totals.get(key)
+            if entry and time.monotonic() - entry[1] < self.ttl:
+                return entry[0]
+            return None
+
+    def set(self, key, total):
+        if total is not None:
+            with self._lock:
+                self._totals[key] = (total, time.monotonic())
+
+    def invalidate(self):
+        with self._lock:
+            self._totals.clear()
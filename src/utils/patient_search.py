@@ -0,0 +1,347 @@
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from .pagination import LOAD_PAGE_SIZE, keyset_page, split_page
+from .search import fold_text, search_terms
+
+# El índice completo se vuelve a leer pasado este tiempo (cambios de otros workers)
+PATIENT_INDEX_TTL = int(os.getenv('PATIENT_INDEX_TTL', 600))
+# Similitud mínima por trigramas, igual que el umbral por defecto de pg_trgm
+TRIGRAM_THRESHOLD = 0.3
+MAX_FUZZY_TOKENS = 20
+# Con más coincidencias que esto se devuelven en orden alfabético en lugar de por peso
+BROAD_MATCHES = 5000
+# Cada cuánto se traen los pacientes creados o cambiados desde la última lectura
+PATIENT_SYNC_SECONDS = int(os.getenv('PATIENT_SYNC_SECONDS', 5))
+# Margen hacia atrás de esa lectura para transacciones que confirmaron tarde
+SYNC_OVERLAP = timedelta(seconds=30)
+PATIENT_INDEX_SELECT = 'id, nombre_completo, telefono, updated_at'
+# Pacientes que se traen de la base cuando el índice no encuentra ninguno
+LOOKUP_LIMIT = 50
+
+def _digits(value):
+    return re.sub(r'\D', '', str(value or ''))
+
+def _trigrams(text):
+    """Trigramas por palabra con relleno, como pg_trgm"""
+    grams = set()
+    for token in text.split():
+        padded = f'  {token} '
+        grams.update(padded[position:position + 3] for position in range(len(padded) - 2))
+    return grams
+
+def _digit_trigrams(digits):
+    return {digits[position:position + 3] for position in range(len(digits) - 2)}
+
+class _SearchData:
+    """Estructuras del índice: palabras ordenadas, trigramas de palabras y teléfonos"""
+
+    def __init__(self):
+        # id -> (nombre plegado, palabras, teléfono en dígitos)
+        self.docs = {}
+        self.tokens = {}
+        self.sorted_tokens = []
+        # Trigramas del vocabulario (no de cada paciente) para los errores de captura
+        self.token_grams = {}
+        self.names = []
+        self.phone_grams = {}
+        self.phones = []
+
+    def _post(self, postings, key, value):
+        postings.setdefault(key, set()).add(value)
+
+    def _unpost(self, postings, key, value):
+        values = postings.get(key)
+        if values is not None:
+            values.discard(value)
+            if not values:
+                del postings[key]
+                return True
+        return False
+
+    def _insert(self, items, item, keep_sorted):
+        if keep_sorted:
+            bisect.insort(items, item)
+        else:
+            items.append(item)
+
+    def add(self, patient_id, nombre, telefono, keep_sorted=True):
+        """Indexar un paciente; en cargas masivas keep_sorted=False y sort() al final"""
+        name = fold_text(nombre)
+        tokens = set(name.split())
+        phone = _digits(telefono)
+        self.docs[patient_id] = (name, tokens, phone)
+        self._insert(self.names, (name, patient_id), keep_sorted)
+        for token in tokens:
+            if token not in self.tokens:
+                self._insert(self.sorted_tokens, token, keep_sorted)
+                for gram in _trigrams(token):
+                    self._post(self.token_grams, gram, token)
+            self._post(self.tokens, token, patient_id)
+        if phone:
+            for gram in _digit_trigrams(phone):
+                self._post(self.phone_grams, gram, patient_id)
+            self._insert(self.phones, (phone, patient_id), keep_sorted)
+
+    def sort(self):
+        self.names.sort()
+        self.sorted_tokens.sort()
+        self.phones.sort()
+
+    def remove(self, patient_id):
+        doc = self.docs.pop(patient_id, None)
+        if doc is None:
+            return
+        name, tokens, phone = doc
+        del self.names[bisect.bisect_left(self.names, (name, patient_id))]
+        for token in tokens:
+            if self._unpost(self.tokens, token, patient_id):
+                del self.sorted_tokens[bisect.bisect_left(self.sorted_tokens, token)]
+                for gram in _trigrams(token):
+                    self._unpost(self.token_grams, gram, token)
+        if phone:
+            for gram in _digit_trigrams(phone):
+                self._unpost(self.phone_grams, gram, patient_id)
+            del self.phones[bisect.bisect_left(self.phones, (phone, patient_id))]
+
+    def _term_tokens(self, term):
+        """Palabras del índice que aceptan el término con su peso.
+
+        2 si es la palabra exacta, 1 si empieza con el término y, si ninguna
+        empieza con él, la similitud de trigramas (menor que 1).
+        """
+        matches = {}
+        position = bisect.bisect_left(self.sorted_tokens, term)
+        while position < len(self.sorted_tokens) and self.sorted_tokens[position].startswith(term):
+            token = self.sorted_tokens[position]
+            matches[token] = 2 if token == term else 1
+            position += 1
+        if matches or len(term) < 3:
+            return matches
+        grams = _trigrams(term)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.token_grams.get(gram, ()))
+        for token, common in shared.most_common(MAX_FUZZY_TOKENS):
+            similarity = common / (len(grams) + len(_trigrams(token)) - common)
+            if similarity >= TRIGRAM_THRESHOLD:
+                matches[token] = similarity
+        return matches
+
+    def search_name(self, terms, k):
+        """Pacientes con una palabra que coincide con cada término, los de mayor peso primero"""
+        matchers = [self._term_tokens(term) for term in set(terms)]
+        if not all(matchers):
+            return []
+        sizes = [sum(len(self.tokens[token]) for token in matcher) for matcher in matchers]
+
+        def score(patient_id):
+            tokens = self.docs[patient_id][1]
+            total = 0
+            for matcher in matchers:
+                best = max((matcher[token] for token in tokens if token in matcher), default=0)
+                if not best:
+                    return None
+                total += best
+            return total
+
+        if min(sizes) > BROAD_MATCHES:
+            # Búsqueda muy amplia ("a", "ma"): se recorren los nombres en orden
+            # alfabético y se toman los primeros k que coinciden, sin ordenar por peso
+            found = []
+            for _, patient_id in self.names:
+                if score(patient_id) is not None:
+                    found.append(patient_id)
+                    if len(found) >= k:
+                        break
+            return found
+
+        # Los candidatos salen del término más selectivo; el resto se verifica por paciente
+        driver = matchers[sizes.index(min(sizes))]
+        candidates = set()
+        for token in driver:
+            candidates.update(self.tokens[token])
+        scored = []
+        for patient_id in candidates:
+            value = score(patient_id)
+            if value is not None:
+                scored.append((-value, self.docs[patient_id][0], patient_id))
+        return [patient_id for _, _, patient_id in heapq.nsmallest(k, scored)]
+
+    def search_phone(self, digits, k):
+        """Teléfonos que contienen los dígitos; los que empiezan con ellos primero"""
+        if len(digits) < 3:
+            position = bisect.bisect_left(self.phones, (digits,))
+            found = []
+            while position < len(self.phones) and len(found) < k and self.phones[position][0].startswith(digits):
+                found.append(self.phones[position][1])
+                position += 1
+            return found
+        postings = sorted((self.phone_grams.get(gram, set()) for gram in _digit_trigrams(digits)), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        scored = []
+        for patient_id in candidates:
+            name, _, phone = self.docs[patient_id]
+            if digits in phone:
+                scored.append((not phone.startswith(digits), not phone.endswith(digits), name, patient_id))
+        return [item[-1] for item in heapq.nsmallest(k, scored)]
+
+class PatientSearchIndex:
+    """Índice en memoria para el buscador de pacientes.
+
+    Nombres sin acentos ni mayúsculas con búsqueda por prefijo de palabra y,
+    para los términos que no son prefijo de ninguna palabra, por trigramas; teléfonos por sus dígitos. Se carga
+    completo la primera vez y cada PATIENT_INDEX_TTL; las altas y cambios de
+    este proceso se aplican al momento y los de otros workers llegan con la
+    lectura incremental por updated_at cada PATIENT_SYNC_SECONDS.
+    """
+
+    def __init__(self, ttl=PATIENT_INDEX_TTL, sync_seconds=PATIENT_SYNC_SECONDS):
+        self.ttl = ttl
+        self.sync_seconds = sync_seconds
+        self._data = _SearchData()
+        self._loaded_at = None
+        self._synced_at = None
+        # Mayor updated_at leído de la base (desde dónde sigue la lectura incremental)
+        self._watermark = None
+        # Cambios recibidos durante una recarga, para aplicarlos también al índice nuevo
+        self._pending = None
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def _fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def ensure(self, supabase):
+        """Cargar el índice si no está, recargarlo si venció y traer los cambios recientes.
+
+        La primera carga bloquea a las búsquedas; una recarga corre en segundo
+        plano (una a la vez) mientras las búsquedas usan el índice anterior.
+        Entre recargas, cada sync_seconds se leen solo los pacientes con
+        updated_at reciente (altas y cambios de otros workers).
+        """
+        if self._loaded_at is None:
+            with self._load_lock:
+                if self._loaded_at is None:
+                    self._load(supabase)
+            return
+        if not self._fresh() and self._load_lock.acquire(blocking=False):
+            threading.Thread(target=self._reload, args=(supabase,), daemon=True).start()
+        if time.monotonic() - self._synced_at >= self.sync_seconds and self._sync_lock.acquire(blocking=False):
+            try:
+                self._sync(supabase)
+            except Exception as e:
+                print(f"Warning: no se leyeron los cambios de pacientes: {e}")
+            finally:
+                self._sync_lock.release()
+
+    def _reload(self, supabase):
+        try:
+            self._load(supabase)
+        except Exception as e:
+            print(f"Warning: no se recargó el índice de pacientes: {e}")
+        finally:
+            self._load_lock.release()
+
+    def _advance(self, patients):
+        for patient in patients:
+            if patient.get('updated_at'):
+                updated_at = datetime.fromisoformat(patient['updated_at'].replace('Z', '+00:00'))
+                with self._lock:
+                    if self._watermark is None or updated_at > self._watermark:
+                        self._watermark = updated_at
+
+    def _load(self, supabase):
+        with self._lock:
+            self._pending = []
+        try:
+            data = _SearchData()
+            for patient in _fetch_patients(supabase):
+                data.add(patient['id'], patient.get('nombre_completo'), patient.get('telefono'), keep_sorted=False)
+                self._advance([patient])
+            data.sort()
+            with self._lock:
+                for patient in self._pending:
+                    self._apply(data, patient)
+                self._data = data
+                self._loaded_at = self._synced_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def _sync(self, supabase):
+        """Aplicar los pacientes con updated_at desde la última lectura (consulta por índice)"""
+        since = self._watermark - SYNC_OVERLAP if self._watermark else None
+        self._synced_at = time.monotonic()
+        for patient in _fetch_patients(supabase, since):
+            self.apply(patient)
+            self._advance([patient])
+
+    def _apply(self, data, patient):
+        previous = data.docs.get(patient['id'])
+        data.remove(patient['id'])
+        # Los upserts de la importación pueden no traer todas las columnas
+        nombre = patient['nombre_completo'] if 'nombre_completo' in patient else (previous[0] if previous else None)
+        telefono = patient['telefono'] if 'telefono' in patient else (previous[2] if previous else None)
+        data.add(patient['id'], nombre, telefono)
+
+    def apply(self, patient):
+        """Reflejar un paciente creado o actualizado"""
+        with self._lock:
+            self._apply(self._data, patient)
+            if self._pending is not None:
+                self._pending.append(patient)
+
+    def apply_many(self, patients):
+        for patient in patients:
+            self.apply(patient)
+
+    def lookup(self, supabase, query, k):
+        """Traer de la base los pacientes que coinciden con query y agregarlos al índice.
+
+        Para cuando la búsqueda no encuentra a nadie (un alta de otro worker que
+        aún no llega con la lectura incremental). search_text está sin acentos
+        y en minúsculas, como los términos, y tiene índice de trigramas.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return
+        request = supabase.table('patients').select(PATIENT_INDEX_SELECT)
+        for term in terms:
+            request = request.ilike('search_text', f'%{term}%')
+        self.apply_many(request.limit(max(k, LOOKUP_LIMIT)).execute().data)
+
+    def search(self, query, k):
+        """Ids de los k pacientes que mejor coinciden, en orden de relevancia"""
+        terms = search_terms(query)
+        if not terms:
+            return []
+        with self._lock:
+            if len(terms) == 1 and terms[0].isdigit():
+                return self._data.search_phone(terms[0], k)
+            return self._data.search_name(terms, k)
+
+def _fetch_patients(supabase, updated_since=None):
+    """Todos los pacientes en páginas por id, o los cambiados desde updated_since por (updated_at, id)"""
+    columns = ['updated_at', 'id'] if updated_since else ['id']
+    cursor = None
+    while True:
+        query = supabase.table('patients').select(PATIENT_INDEX_SELECT)
+        if updated_since:
+            query = query.gte('updated_at', updated_since.isoformat())
+        page, cursor = split_page(
+            keyset_page(query, columns, cursor, LOAD_PAGE_SIZE, descending=False).execute().data,
+            columns, LOAD_PAGE_SIZE
+        )
+        yield from page
+        if not cursor:
+            return
+
+patient_search_index = PatientSearchIndex()
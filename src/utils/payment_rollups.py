@@ -0,0 +1,84 @@
+# Totales diarios de ingresos (tabla payment_daily_totals, ver migración 003)
+
+def _group_totals(payments):
+    """Agrupar pagos por (día, método, cajero) con suma, conteo, descuentos y cambio"""
+    groups = {}
+    for payment in payments:
+        key = (
+            str(payment['created_at'])[:10],
+            payment.get('payment_method') or 'desconocido',
+            payment.get('cashier_id')
+        )
+        total = groups.setdefault(
+            key, {'total_amount': 0, 'payments_count': 0, 'discount_total': 0, 'change_total': 0}
+        )
+        total['total_amount'] += float(payment.get('total_amount') or 0)
+        total['payments_count'] += 1
+        total['discount_total'] += float(payment.get('discount') or 0)
+        total['change_total'] += float(payment.get('change_amount') or 0)
+    return [
+        {
+            'day': day,
+            'payment_method': method,
+            'cashier_id': cashier_id,
+            'total_amount': round(total['total_amount'], 2),
+            'payments_count': total['payments_count'],
+            'discount_total': round(total['discount_total'], 2),
+            'change_total': round(total['change_total'], 2)
+        }
+        for (day, method, cashier_id), total in groups.items()
+    ]
+
+def record_payments(supabase, payments):
+    """Sumar pagos recién creados a los totales diarios en una sola llamada.
+
+    Un fallo no deshace el pago: se avisa y los totales se corrigen con
+    rebuild_daily_totals.
+    """
+    totals = _group_totals(payments)
+    if not totals:
+        return True
+    try:
+        supabase.rpc('add_payment_daily_totals', {'p_totals': totals}).execute()
+        return True
+    except Exception as e:
+        print(f"Warning: no se actualizaron los totales diarios de pagos: {e}")
+        return False
+
+def rebuild_daily_totals(supabase, date_from=None, date_to=None):
+    """Recalcular los totales desde el historial de pagos; devuelve los grupos escritos"""
+    result = supabase.rpc('rebuild_payment_daily_totals', {'p_from': date_from, 'p_to': date_to}).execute()
+    return result.data
+
+def daily_totals(supabase, date_from, date_to=None, cashier_id=None):
+    """Totales por día, método y cajero desde date_from (una fila por grupo, no por pago)"""
+    query = supabase.table('payment_daily_totals').select(
+        'day, payment_method, cashier_id, total_amount, payments_count, discount_total, change_total'
+    ).gte('day', str(date_from))
+    if date_to:
+        query = query.lte('day', str(date_to))
+    if cashier_id:
+        query = query.eq('cashier_id', cashier_id)
+    return query.execute().data
+
+TOTAL_FIELDS = ['total_amount', 'payments_count', 'discount_total', 'change_total']
+
+def cashier_totals(rows):
+    """Totales de un día agrupados por cajero y método de pago.
+
+    Devuelve {cashier_id: {'methods': {método: totales}, 'totals': totales}}.
+    """
+    cashiers = {}
+    for row in rows:
+        cashier = cashiers.setdefault(row['cashier_id'], {
+            'methods': {},
+            'totals': dict.fromkeys(TOTAL_FIELDS, 0)
+        })
+        method = {field: row.get(field) or 0 for field in TOTAL_FIELDS}
+        cashier['methods'][row['payment_method']] = method
+        for field in TOTAL_FIELDS:
+            cashier['totals'][field] += float(method[field]) if field != 'payments_count' else method[field]
+    for cashier in cashiers.values():
+        for field in ('total_amount', 'discount_total', 'change_total'):
+            cashier['totals'][field] = round(cashier['totals'][field], 2)
+    return cashiers
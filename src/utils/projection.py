@@ -0,0 +1,36 @@
+import re
+
+# Solo columnas simples: fields= no puede agregar relaciones ni filtros al select
+_FIELD = re.compile(r'^[a-z_][a-z0-9_]*$')
+# Columnas de búsqueda de pagos y pacientes (migraciones 005 y 010): no son parte de la API
+SEARCH_COLUMNS = ('search_text', 'search_vector')
+
+def public_row(row):
+    """Fila sin las columnas de búsqueda, para devolverla en la API"""
+    return {key: value for key, value in row.items() if key not in SEARCH_COLUMNS}
+
+def public_rows(rows):
+    return [public_row(row) for row in rows]
+
+def parse_fields(value, required=()):
+    """Select de PostgREST con las columnas pedidas en fields= (más las requeridas)"""
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    invalid = [field for field in fields if not _FIELD.match(field)]
+    if invalid or not fields:
+        raise ValueError(f"Campos no válidos: {', '.join(invalid) or value}")
+    return ', '.join(dict.fromkeys([*fields, *required]))
+
+def list_select(args, full, summary, required=()):
+    """Elegir el select de un listado según fields= o view=summary|full.
+
+    Devuelve (select, lean): con lean=True el listado se devuelve tal cual,
+    sin el procesamiento adicional de la vista completa.
+    """
+    if args.get('fields'):
+        return parse_fields(args['fields'], required), True
+    view = args.get('view') or 'full'
+    if view == 'summary':
+        return summary, True
+    if view != 'full':
+        raise ValueError("view debe ser 'summary' o 'full'")
+    return full, False
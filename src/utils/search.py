@@ -0,0 +1,31 @@
+import re
+import unicodedata
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+_PHONE_LIKE = re.compile(r'^[\d\s()+.-]+$')
+# Un solo término alfanumérico con algún dígito (p. ej. T20250101ABC123 o ABC123)
+_TICKET_LIKE = re.compile(r'^[A-Za-z0-9-]*\d[A-Za-z0-9-]*$')
+
+def fold_text(value):
+    """Minúsculas sin acentos ni signos, igual que lower(unaccent(...)) en la base de datos"""
+    if value is None:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(value))
+    plain = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(' ', plain.lower()).strip()
+
+def search_terms(value):
+    """Términos de búsqueda; un teléfono con separadores se busca como un solo número"""
+    if value and _PHONE_LIKE.match(value) and any(char.isdigit() for char in value):
+        return [re.sub(r'\D', '', value)]
+    return fold_text(value).split()
+
+def prefix_tsquery(value):
+    """tsquery de prefijos ('ana:*&lopez:*') para columnas tsvector con config simple"""
+    # Los términos solo tienen [a-z0-9], así que no pueden alterar la sintaxis del tsquery
+    return '&'.join(f'{term}:*' for term in search_terms(value))
+
+def ticket_term(value):
+    """Término a buscar dentro del número de ticket, o None si no parece un ticket"""
+    value = (value or '').strip()
+    return value if _TICKET_LIKE.match(value) else None
@@ -0,0 +1,84 @@
+"""Cruces de citas y huecos libres de la agenda"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from src.utils.availability import AvailabilityIndex, _gaps, overlapping_booking
+
+MONDAY = date(2024, 1, 8)
+SUNDAY = date(2024, 1, 7)
+
+def _booking(appointment_id, start, minutes=30, operadora_id='op-1', status='agendada'):
+    return {
+        'id': appointment_id, 'operadora_id': operadora_id, 'fecha_hora': f'{MONDAY}T{start}:00',
+        'duracion_minutos': minutes, 'status': status
+    }
+
+def _at(clock, day=MONDAY):
+    hours, minutes = clock.split(':')
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=int(hours), minutes=int(minutes))
+
+@pytest.mark.parametrize('start, minutes, expected', [
+    ('09:30', 30, 'a1'),   # mismo horario
+    ('09:45', 30, 'a1'),   # empieza dentro
+    ('09:00', 45, 'a1'),   # termina dentro
+    ('09:00', 120, 'a1'),  # la contiene
+    ('09:00', 30, None),   # termina justo al empezar la otra
+    ('10:00', 30, None),   # empieza justo al terminar la otra
+])
+def test_overlapping_booking(start, minutes, expected):
+    bookings = [_booking('a1', '09:30')]
+    assert overlapping_booking(bookings, _booking('new', start, minutes)) == expected
+
+def test_overlapping_booking_excludes_the_appointment_itself():
+    bookings = [_booking('a1', '09:30'), _booking('a2', '11:00')]
+    moved = _booking('a1', '09:45')
+    assert overlapping_booking(bookings, moved, exclude_id='a1') is None
+    assert overlapping_booking(bookings, _booking('a1', '10:45'), exclude_id='a1') == 'a2'
+
+def test_overlapping_booking_uses_default_duration():
+    bookings = [{**_booking('a1', '09:30'), 'duracion_minutos': None}]
+    assert overlapping_booking(bookings, _booking('new', '09:55', 10)) == 'a1'
+    assert overlapping_booking(bookings, _booking('new', '10:00', 10)) is None
+
+def test_gaps_skip_busy_intervals_and_align_to_step():
+    busy = [(_at('09:00'), _at('09:40'), 'a1'), (_at('10:30'), _at('11:00'), 'a2')]
+    starts = list(_gaps(busy, _at('09:00'), _at('11:30'), timedelta(minutes=30), timedelta(minutes=15)))
+    assert starts == [_at('09:45'), _at('10:00'), _at('11:00')]
+
+def test_gaps_respect_not_before():
+    starts = list(_gaps(
+        [], _at('09:00'), _at('10:00'), timedelta(minutes=30), timedelta(minutes=15), not_before=_at('09:10')
+    ))
+    assert starts == [_at('09:15'), _at('09:30')]
+
+def test_gaps_of_a_full_day_are_empty():
+    busy = [(_at('09:00'), _at('19:00'), 'a1')]
+    assert list(_gaps(busy, _at('09:00'), _at('19:00'), timedelta(minutes=15), timedelta(minutes=15))) == []
+
+def test_free_slots_merge_operadoras_in_time_order():
+    index = AvailabilityIndex()
+    index.apply_many([
+        _booking('a1', '09:00', 60, 'op-1'),
+        _booking('a2', '09:00', 30, 'op-2'),
+    ])
+    slots = index.free_slots(['op-1', 'op-2'], 30, MONDAY, 1, 3)
+    assert [(slot['operadora_id'], slot['start']) for slot in slots] == [
+        ('op-2', _at('09:30')), ('op-2', _at('09:45')), ('op-1', _at('10:00'))
+    ]
+    assert slots[0]['end'] == _at('10:00')
+
+def test_free_slots_skip_closed_weekdays():
+    slots = AvailabilityIndex().free_slots(['op-1'], 30, SUNDAY, 2, 1)
+    assert slots[0]['start'] == _at('09:00', MONDAY)
+
+def test_apply_moves_and_frees_appointments():
+    index = AvailabilityIndex()
+    index.apply(_booking('a1', '09:00'))
+    index.apply(_booking('a1', '10:00'))
+    assert [interval[2] for interval in index.busy('op-1', MONDAY)] == ['a1']
+    assert index.busy('op-1', MONDAY)[0][0] == _at('10:00')
+    index.apply(_booking('a1', '10:00', status='cancelada'))
+    assert index.busy('op-1', MONDAY) == []
+    index.apply({**_booking('a2', '10:00'), 'operadora_id': None})
+    assert index.busy('op-1', MONDAY) == []
@@ -0,0 +1,119 @@
+"""Bus de eventos de citas: reenvío con Last-Event-ID, desbordes y filtros"""
+import pytest
+
+from src.utils import events
+from src.utils.events import EventBus, appointment_event
+
+def _event(day='2024-01-05', operadora_id='op-1'):
+    return {'type': 'appointment.updated', 'dates': [day], 'operadora_ids': [operadora_id]}
+
+def _drain(subscription):
+    received = []
+    while True:
+        event = subscription.get(timeout=0)
+        if event is None:
+            return received
+        received.append(event)
+
+def test_publish_assigns_increasing_ids():
+    bus = EventBus()
+    assert [bus.publish(_event())['id'] for _ in range(3)] == [f'{bus.instance}-{n}' for n in (1, 2, 3)]
+
+def test_subscribers_receive_published_events():
+    bus = EventBus()
+    with bus.subscribe() as subscription:
+        published = bus.publish(_event())
+        assert _drain(subscription) == [published]
+    assert bus.subscriber_count == 0
+
+def test_replay_after_last_event_id():
+    bus = EventBus()
+    published = [bus.publish(_event()) for _ in range(5)]
+    with bus.subscribe(last_event_id=published[1]['id']) as subscription:
+        assert _drain(subscription) == published[2:]
+        assert not subscription.overflowed
+
+def test_replay_up_to_date_sends_nothing():
+    bus = EventBus()
+    last = bus.publish(_event())
+    with bus.subscribe(last_event_id=last['id']) as subscription:
+        assert _drain(subscription) == []
+        assert not subscription.overflowed
+
+def test_replay_beyond_history_asks_for_resync():
+    bus = EventBus(history_size=3)
+    published = [bus.publish(_event()) for _ in range(6)]
+    with bus.subscribe(last_event_id=published[0]['id']) as subscription:
+        assert subscription.overflowed
+        assert _drain(subscription) == published[3:]
+
+def test_id_from_another_instance_asks_for_resync():
+    # Otro worker o el mismo proceso antes de un reinicio
+    previous = EventBus()
+    stale_id = [previous.publish(_event()) for _ in range(3)][0]['id']
+    bus = EventBus()
+    published = [bus.publish(_event()) for _ in range(3)]
+    with bus.subscribe(last_event_id=stale_id) as subscription:
+        assert subscription.overflowed
+        assert _drain(subscription) == []
+    with bus.subscribe(last_event_id=published[0]['id']) as subscription:
+        assert not subscription.overflowed
+        assert _drain(subscription) == published[1:]
+
+@pytest.mark.parametrize('last_event_id', ['basura', '12', 'abc-', 'abc-x'])
+def test_invalid_last_event_id_asks_for_resync(last_event_id):
+    bus = EventBus()
+    with bus.subscribe(last_event_id=last_event_id) as subscription:
+        assert subscription.overflowed
+
+def test_future_id_of_this_instance_asks_for_resync():
+    bus = EventBus()
+    bus.publish(_event())
+    with bus.subscribe(last_event_id=f'{bus.instance}-5') as subscription:
+        assert subscription.overflowed
+
+def test_slow_subscriber_overflows():
+    bus = EventBus()
+    subscription = bus.subscribe()
+    subscription._queue.maxsize = 2
+    published = [bus.publish(_event()) for _ in range(4)]
+    assert subscription.overflowed
+    assert _drain(subscription) == published[:2]
+    subscription.close()
+
+def test_filter_applies_to_live_and_replayed_events():
+    bus = EventBus()
+    first = bus.publish(_event(day='2024-01-03'))
+    bus.publish(_event(day='2024-01-04'))
+    replayed = bus.publish(_event(day='2024-01-05'))
+    with bus.subscribe(lambda event: '2024-01-05' in event['dates'], last_event_id=first['id']) as subscription:
+        bus.publish(_event(day='2024-01-06'))
+        live = bus.publish(_event(day='2024-01-05', operadora_id='op-2'))
+        assert _drain(subscription) == [replayed, live]
+
+def test_appointment_event_lists_both_days_of_a_move():
+    before = {'id': 'a1', 'fecha_hora': '2024-01-05T10:00:00', 'operadora_id': 'op-1'}
+    after = {**before, 'fecha_hora': '2024-01-08T12:00:00', 'operadora_id': 'op-2', 'status': 'agendada'}
+    event = appointment_event('appointment.updated', before, after)
+    assert event['dates'] == ['2024-01-05', '2024-01-08']
+    assert event['operadora_ids'] == ['op-1', 'op-2']
+    assert event['fecha_hora'] == after['fecha_hora']
+
+def test_set_event_bus_replaces_the_bus():
+    previous = events.get_event_bus()
+    replacement = EventBus()
+    try:
+        events.set_event_bus(replacement)
+        assert events.get_event_bus() is replacement
+    finally:
+        events.set_event_bus(previous)
+
+def test_event_bus_from_environment(monkeypatch):
+    previous = events.get_event_bus()
+    monkeypatch.setenv('EVENT_BUS', 'src.utils.events:EventBus')
+    try:
+        events.set_event_bus(None)
+        assert isinstance(events.get_event_bus(), EventBus)
+        assert events.get_event_bus() is not previous
+    finally:
+        events.set_event_bus(previous)
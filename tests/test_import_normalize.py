@@ -0,0 +1,40 @@
+"""Los normalizadores vectorizados deben dar lo mismo que los helpers por fila"""
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.routes.import_data import clean_phone_number, parse_date
+from src.utils.import_normalize import normalize_dates, normalize_phones
+
+PHONE_VALUES = [
+    '55 1234 5678', '(55) 1234-5678', '+52 55 1234 5678', '  5512345678  ', 'sin teléfono', '',
+    '+', '5.5', 5512345678, 5512345678.0, 12.5, 0, None, np.nan, '٥٥١٢', 'ext. 12 + 3'
+]
+
+DATE_VALUES = [
+    '2024-01-05', '2024-1-5', '05/01/2024', '5/1/2024', '01/13/2024', '13/01/2024', '31/02/2024',
+    '05-01-2024', '5-1-2024', '0201-01-05', '2024/01/05', ' 2024-01-05', '2024-01-05 ',
+    '2024-01-05 10:30:00', '20240105', '', 'mañana', '29/02/2023', '29/02/2024', '1900-01-01',
+    '9999-12-31', datetime(2024, 1, 5, 10, 30), pd.Timestamp('2023-12-31 23:59'), date(2024, 1, 5),
+    45000, 45000.5, None, np.nan, pd.NaT
+]
+
+@pytest.mark.parametrize('value', PHONE_VALUES)
+def test_normalize_phones_matches_clean_phone_number(value):
+    series = pd.Series([value, '55 0000 0000'], dtype=object)
+    assert normalize_phones(series).tolist() == [clean_phone_number(value), '5500000000']
+
+@pytest.mark.parametrize('value', DATE_VALUES)
+def test_normalize_dates_matches_parse_date(value):
+    series = pd.Series([value, '2024-01-05'], dtype=object)
+    assert normalize_dates(series).tolist() == [parse_date(value), '2024-01-05']
+
+def test_normalize_dates_whole_column():
+    series = pd.Series(DATE_VALUES, dtype=object)
+    assert normalize_dates(series).tolist() == [parse_date(value) for value in DATE_VALUES]
+
+def test_normalize_dates_datetime_column():
+    series = pd.Series(pd.to_datetime(['2024-01-05 10:00', None, '1999-12-31 00:00']))
+    assert normalize_dates(series).tolist() == [parse_date(value) for value in series]
@@ -0,0 +1,82 @@
+"""Cursores opacos y paginación por keyset"""
+import pytest
+
+from src.utils.pagination import (
+    SUPABASE_MAX_ROWS, decode_cursor, encode_cursor, keyset_filter, keyset_page, parse_count, parse_limit,
+    split_page
+)
+
+COLUMNS = ['created_at', 'id']
+
+class _RecordingQuery:
+    """Guarda las llamadas que keyset_page hace sobre la consulta"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return call
+
+def test_cursor_round_trip():
+    row = {'created_at': '2024-01-05T10:00:00+00:00', 'id': 'a1', 'monto': 10}
+    cursor = encode_cursor(row, COLUMNS)
+    assert '=' not in cursor
+    assert decode_cursor(cursor, COLUMNS) == ['2024-01-05T10:00:00+00:00', 'a1']
+
+@pytest.mark.parametrize('cursor', [
+    'no es base64!',
+    encode_cursor({'id': 'a1'}, ['id']),                           # columnas de menos
+    encode_cursor({'created_at': None, 'id': 'a1'}, COLUMNS),      # valor nulo
+    'eyJhIjoxfQ',                                                  # {"a":1}, no es lista
+    '',
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match='Cursor inválido'):
+        decode_cursor(cursor, COLUMNS)
+
+def test_keyset_filter_expands_row_comparison():
+    assert keyset_filter(COLUMNS, ['2024-01-05', 'a1']) == (
+        'created_at.lt."2024-01-05",and(created_at.eq."2024-01-05",id.lt."a1")'
+    )
+    assert keyset_filter(['id'], [7], descending=False) == 'id.gt."7"'
+
+def test_keyset_filter_quotes_special_characters():
+    assert keyset_filter(['nombre'], ['Ana "la" (Dra.), 10:00\\']) == (
+        'nombre.lt."Ana \\"la\\" (Dra.), 10:00\\\\"'
+    )
+
+def test_split_page_returns_cursor_only_when_there_is_more():
+    rows = [{'created_at': f'2024-01-0{day}', 'id': f'a{day}'} for day in range(1, 4)]
+    page, cursor = split_page(rows, COLUMNS, 2)
+    assert page == rows[:2]
+    assert decode_cursor(cursor, COLUMNS) == ['2024-01-02', 'a2']
+    assert split_page(rows, COLUMNS, 3) == (rows, None)
+    assert split_page([], COLUMNS, 3) == ([], None)
+
+def test_keyset_page_applies_cursor_order_and_extra_row():
+    cursor = encode_cursor({'created_at': '2024-01-05', 'id': 'a1'}, COLUMNS)
+    query = keyset_page(_RecordingQuery(), COLUMNS, cursor, 50)
+    assert query.calls == [
+        ('or_', (keyset_filter(COLUMNS, ['2024-01-05', 'a1']),), {}),
+        ('order', ('created_at',), {'desc': True}),
+        ('order', ('id',), {'desc': True}),
+        ('limit', (51,), {}),
+    ]
+
+def test_keyset_page_rejects_pages_at_the_row_cap():
+    # La fila extra no llegaría y la lectura se cortaría sin cursor
+    keyset_page(_RecordingQuery(), COLUMNS, None, SUPABASE_MAX_ROWS - 1)
+    with pytest.raises(ValueError):
+        keyset_page(_RecordingQuery(), COLUMNS, None, SUPABASE_MAX_ROWS)
+
+def test_parse_limit_and_count():
+    assert parse_limit(None) == 50
+    assert parse_limit('0') == 1
+    assert parse_limit('10000') == 500
+    assert parse_count('') is None
+    assert parse_count('exact') == 'exact'
+    with pytest.raises(ValueError):
+        parse_count('planned')
@@ -0,0 +1,135 @@
+"""Índice en memoria del buscador de pacientes"""
+import re
+
+import pytest
+
+from src.utils.patient_search import PatientSearchIndex, _SearchData
+
+PATIENTS = [
+    ('p1', 'Ana María López', '55 1234 5678'),
+    ('p2', 'Anabel Ruiz', '5587654321'),
+    ('p3', 'José Hernández', '(33) 5512-0000'),
+    ('p4', 'Mariana Ortega', None),
+]
+
+# Condiciones col.op."valor" de keyset_filter
+_CONDITION = re.compile(r'(\w+)\.(gt|eq)\."((?:[^"\\]|\\.)*)"')
+
+class _FakeQuery:
+    """Lo mínimo de postgrest que usa _fetch_patients, con el tope de max-rows"""
+
+    def __init__(self, client):
+        self.client = client
+        self.filters = []
+        self.orders = []
+        self.count = None
+
+    def select(self, columns):
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row[column] >= value)
+        return self
+
+    def or_(self, expression):
+        branches = [_CONDITION.findall(branch) for branch in re.split(r',(?![^(]*\))', expression)]
+
+        def matches(row):
+            return any(
+                all(row[column] > value if op == 'gt' else row[column] == value for column, op, value in branch)
+                for branch in branches
+            )
+
+        self.filters.append(matches)
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append(column)
+        return self
+
+    def limit(self, count):
+        self.count = count
+        return self
+
+    def execute(self):
+        self.client.requests += 1
+        rows = [row for row in self.client.rows if all(check(row) for check in self.filters)]
+        rows.sort(key=lambda row: [row[column] for column in self.orders])
+        return type('Result', (), {'data': rows[:min(self.count, self.client.max_rows)]})
+
+class _FakeClient:
+    def __init__(self, rows, max_rows=1000):
+        self.rows = rows
+        self.max_rows = max_rows
+        self.requests = 0
+
+    def table(self, name):
+        return _FakeQuery(self)
+
+@pytest.fixture
+def data():
+    data = _SearchData()
+    for patient_id, nombre, telefono in PATIENTS:
+        data.add(patient_id, nombre, telefono)
+    return data
+
+def test_prefix_matches_whole_words_first(data):
+    assert data.search_name(['ana'], 10) == ['p1', 'p2']
+    assert data.search_name(['mari'], 10) == ['p1', 'p4']
+
+def test_all_terms_must_match(data):
+    assert data.search_name(['ana', 'lopez'], 10) == ['p1']
+    assert data.search_name(['ana', 'ortega'], 10) == []
+
+def test_accents_are_ignored(data):
+    assert data.search_name(['hernandez'], 10) == ['p3']
+
+def test_trigrams_find_typos(data):
+    assert data.search_name(['hernandes'], 10) == ['p3']
+    assert data.search_name(['xyzw'], 10) == []
+
+def test_phone_search_by_digits(data):
+    assert data.search_phone('5512', 10) == ['p1', 'p3']
+    assert data.search_phone('4321', 10) == ['p2']
+    assert data.search_phone('55', 10) == ['p1', 'p2']
+
+def test_remove_and_apply_update_the_index():
+    index = PatientSearchIndex()
+    index.apply_many([{'id': patient_id, 'nombre_completo': nombre, 'telefono': telefono}
+                      for patient_id, nombre, telefono in PATIENTS])
+    index.apply({'id': 'p2', 'nombre_completo': 'Beatriz Ruiz'})
+    assert index.search('ana', 10) == ['p1']
+    assert index.search('beatriz', 10) == ['p2']
+    # Sin telefono en el cambio se conserva el anterior
+    assert index.search('5587654321', 10) == ['p2']
+    index._data.remove('p1')
+    assert index.search('ana', 10) == []
+    assert index.search('5512', 10) == ['p3']
+
+def test_load_pages_past_max_rows():
+    rows = [
+        {'id': f'{number:05d}', 'nombre_completo': f'Paciente {number}', 'telefono': None,
+         'updated_at': '2024-01-05T10:00:00+00:00'}
+        for number in range(2500)
+    ]
+    rows.append({**rows[0], 'id': '99999', 'nombre_completo': 'Última Alta'})
+    client = _FakeClient(rows)
+    index = PatientSearchIndex()
+    index.ensure(client)
+    assert len(index._data.docs) == len(rows)
+    assert index.search('ultima', 10) == ['99999']
+    assert client.requests > 2
+
+def test_sync_reads_changes_from_other_workers():
+    rows = [{'id': patient_id, 'nombre_completo': nombre, 'telefono': telefono,
+             'updated_at': '2024-01-05T10:00:00+00:00'} for patient_id, nombre, telefono in PATIENTS]
+    client = _FakeClient(rows)
+    index = PatientSearchIndex(sync_seconds=0)
+    index.ensure(client)
+    rows.append({'id': 'p5', 'nombre_completo': 'Zoe Navarro', 'telefono': None,
+                 'updated_at': '2024-01-05T11:00:00+00:00'})
+    rows[0] = {**rows[0], 'nombre_completo': 'Ana Lucía López', 'updated_at': '2024-01-05T11:00:00+00:00'}
+    index.ensure(client)
+    assert index.search('zoe', 10) == ['p5']
+    assert index.search('lucia', 10) == ['p1']
+    assert index.search('maria', 10) == ['p4']